@@ -12,6 +12,9 @@ source files (corresponding articles need to have identical names)
 from lxml import etree
 import argparse
 
+from alignment_xml import iter_links
+import alignment_db
+
 
 # global variables
 # parsing xml with utf-8 encoding and removing blank text
@@ -27,7 +30,12 @@ def parse_args():
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
-        "-i", "--input", required=True, action="store", dest="f_in", help="input file"
+        "-i",
+        "--input",
+        required=True,
+        action="store",
+        dest="f_in",
+        help="input file (alignment xml or SQLite database of bleualign_articles.py --db)",
     )
     parser.add_argument(
         "-o",
@@ -45,6 +53,39 @@ def parse_args():
         dest="dir_trans",
         help="translation dir",
     )
+    parser.add_argument(
+        "-y",
+        "--years",
+        required=False,
+        default=None,
+        nargs="+",
+        type=int,
+        action="store",
+        dest="years",
+        help="years to export from a database (default: all years)",
+    )
+    parser.add_argument(
+        "-m",
+        "--methods",
+        required=False,
+        default=None,
+        nargs="+",
+        action="store",
+        dest="methods",
+        help="alignment methods to export from a database (e.g. BLEU number_length_matching)",
+    )
+    parser.add_argument(
+        "-k",
+        "--kinds",
+        required=False,
+        default=["parallel", "comparable"],
+        nargs="+",
+        choices=["parallel", "comparable"],
+        action="store",
+        dest="kinds",
+        help="kinds of alignments to export from a database "
+        "(default: both, like the xml of bleualign_articles.py -c)",
+    )
 
     return parser.parse_args()
 
@@ -62,21 +103,21 @@ def read_src_translation(f_trans):
     return trans_articles
 
 
-def import_alignments(f_align):
+def import_alignments(f_align, years=None, methods=None, kinds=None):
     """read the alignment pairs"""
 
-    xml = etree.parse(f_align, parser).getroot()
-
     alignments = {}
 
-    # collection of aligned src and trg filename
-    for collection in xml.xpath("//linkGrp"):
-        # files = collection.get('xtargets').split(';')
-        # langs = collection.get('lang').split(';')
+    # collection of aligned src and trg filename, parsed link by link
+    # or queried from the database
+    if alignment_db.is_alignment_db(f_align):
+        links = alignment_db.query_pairs(f_align, years, methods, kinds)
+    else:
+        links = iter_links(f_align)
 
-        for article in collection.getchildren():
-            src, trg = article.get("xtargets").split(";")
-            alignments[src] = trg
+    for link in links:
+        src, trg = link["xtargets"].split(";")
+        alignments[src] = trg
 
     return alignments
 
@@ -92,7 +133,7 @@ def main():
 
     # src_translations = read_src_translation(f_trans)
 
-    alignments = import_alignments(f_align)
+    alignments = import_alignments(f_align, args.years, args.methods, args.kinds)
 
     with open(f_out, "w") as f:
         for src, trg in alignments.items():
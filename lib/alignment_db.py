@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Store the article alignments, the features of the article pairs chosen by the
+alignment engine and the statistics of many years in a single indexed SQLite database, so that
+questions across years do not require parsing every yearly file
+"""
+
+# imported modules
+import sqlite3
+
+# global variables
+# tables of the store and the indexes to query them by docid, year and method
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairs (
+    year INTEGER,
+    position INTEGER,
+    kind TEXT,
+    method TEXT,
+    src TEXT,
+    trg TEXT,
+    src_docid TEXT,
+    trg_docid TEXT,
+    bleu REAL,
+    overlap_numbers REAL,
+    number_length_score REAL,
+    cosine_similarity REAL
+);
+CREATE TABLE IF NOT EXISTS features (
+    year INTEGER,
+    src TEXT,
+    trg TEXT,
+    src_docid TEXT,
+    trg_docid TEXT,
+    bleu REAL,
+    overlap_numbers REAL,
+    length_ratio REAL,
+    cosine_similarity REAL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    year INTEGER,
+    key TEXT,
+    value
+);
+CREATE INDEX IF NOT EXISTS pairs_year ON pairs (year);
+CREATE INDEX IF NOT EXISTS pairs_method ON pairs (method);
+CREATE INDEX IF NOT EXISTS pairs_src_docid ON pairs (src_docid);
+CREATE INDEX IF NOT EXISTS pairs_trg_docid ON pairs (trg_docid);
+CREATE INDEX IF NOT EXISTS features_year ON features (year);
+CREATE INDEX IF NOT EXISTS features_src_docid ON features (src_docid);
+CREATE INDEX IF NOT EXISTS features_trg_docid ON features (trg_docid);
+CREATE INDEX IF NOT EXISTS stats_year ON stats (year);
+"""
+
+PAIR_COLUMNS = [
+    "year",
+    "position",
+    "kind",
+    "method",
+    "src",
+    "trg",
+    "src_docid",
+    "trg_docid",
+    "bleu",
+    "overlap_numbers",
+    "number_length_score",
+    "cosine_similarity",
+]
+
+FEATURE_COLUMNS = [
+    "year",
+    "src",
+    "trg",
+    "src_docid",
+    "trg_docid",
+    "bleu",
+    "overlap_numbers",
+    "length_ratio",
+    "cosine_similarity",
+]
+
+# first bytes of every SQLite database file
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+################################################################################
+
+
+def is_alignment_db(fname):
+    """checks whether a file is a SQLite database rather than an alignment xml"""
+
+    with open(fname, "rb") as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def connect(fname):
+    """opens the store and creates the tables and indexes if necessary"""
+
+    # the years may be written by several worker processes at the same time
+    connection = sqlite3.connect(fname, timeout=600)
+    connection.executescript(SCHEMA)
+
+    return connection
+
+
+def insert_statement(table, columns):
+
+    return "INSERT INTO {} ({}) VALUES ({})".format(
+        table, ", ".join(columns), ", ".join("?" * len(columns))
+    )
+
+
+def store_year(fname, year, alignments, pairs, stats, docids):
+    """
+    replaces the alignments, the pair features and the statistics of a year in a single transaction
+
+    alignments: (kind, alignments) tuples in the order of the output, e.g. ("parallel", [...])
+    pairs: features of the article pairs chosen by the engine, with the source and target paths
+    docids: docid of each article path
+    """
+
+    pair_rows = (
+        (year, position, kind, aligned.get("method"), aligned["src"], aligned["trg"])
+        + (docids.get(aligned["src"]), docids.get(aligned["trg"]))
+        + tuple(aligned.get(key) for key in PAIR_COLUMNS[8:])
+        for kind, kind_alignments in alignments
+        for position, aligned in enumerate(kind_alignments)
+    )
+    feature_rows = (
+        (year, pair["src"], pair["trg"], docids.get(pair["src"]), docids.get(pair["trg"]))
+        + tuple(pair[key] for key in FEATURE_COLUMNS[5:])
+        for pair in pairs
+    )
+    stats_rows = ((year, key, value) for key, value in sorted(stats.items()))
+
+    connection = connect(fname)
+    try:
+        # the year is locked for writing from the start, so other processes wait instead of failing
+        connection.execute("BEGIN IMMEDIATE")
+        for table in ["pairs", "features", "stats"]:
+            connection.execute(f"DELETE FROM {table} WHERE year IS ?", (year,))
+        connection.executemany(insert_statement("pairs", PAIR_COLUMNS), pair_rows)
+        connection.executemany(insert_statement("features", FEATURE_COLUMNS), feature_rows)
+        connection.executemany(insert_statement("stats", ["year", "key", "value"]), stats_rows)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+################################################################################
+
+
+def query_pairs(fname, years=None, methods=None, kinds=None):
+    """yields the stored alignments as dicts (with xtargets like the links of an alignment xml)"""
+
+    conditions = []
+    parameters = []
+    for column, values in [("year", years), ("method", methods), ("kind", kinds)]:
+        if values:
+            conditions.append("{} IN ({})".format(column, ", ".join("?" * len(values))))
+            parameters += list(values)
+
+    query = "SELECT * FROM pairs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY year, kind DESC, position"
+
+    connection = sqlite3.connect(fname)
+    connection.row_factory = sqlite3.Row
+    try:
+        for row in connection.execute(query, parameters):
+            link = dict(row)
+            link["xtargets"] = link["src"] + ";" + link["trg"]
+            yield link
+    finally:
+        connection.close()
+
+
+def query_years(fname):
+    """returns the years in the store"""
+
+    connection = sqlite3.connect(fname)
+    try:
+        return [
+            year for year, in connection.execute("SELECT DISTINCT year FROM pairs ORDER BY year")
+        ]
+    finally:
+        connection.close()
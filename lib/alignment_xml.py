@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+Write and read article alignment files (TEI with a linkGrp of links)
+incrementally, so that the memory does not depend on the number of links
+"""
+
+# imported modules
+import itertools
+import math
+import re
+from lxml import etree
+
+
+################################################################################
+
+
+def link_element(aligned):
+    """creates the link element of an aligned article pair"""
+
+    article = etree.Element("link")
+    article.set("targType", "article")
+    article.set("method", aligned.get("method"))
+    # pairs aligned without computing BLEU (e.g. by their titles) have an empty score
+    bleu = aligned.get("bleu")
+    article.set("bleu", "" if math.isnan(bleu) else f"{bleu:.2f}")
+    article.set("overlap_numbers", f'{aligned.get("overlap_numbers"):.2f}')
+    article.set("cosine_similarity", f'{aligned.get("cosine_similarity", 0):.2f}')
+    article.set("xtargets", aligned["src"] + ";" + aligned["trg"])
+
+    return article
+
+
+def write_alignments_to_xml(alignments, outfile):
+    """uses the computed alignments (any iterable) to write an article alignment xml link by link"""
+
+    alignments = iter(alignments)
+    first = next(alignments, None)
+
+    with open(outfile, "wb") as f:
+        with etree.xmlfile(f, encoding="UTF-8") as xf:
+            xf.write_declaration()
+
+            if first is None:
+                xf.write(etree.Element("TEI"))
+                print("No alignments found.")
+            else:
+                with xf.element("TEI"):
+                    header = etree.Element("teiHeader")
+                    header.text = first["src"][:14]  # extract path to language folder
+                    xf.write("\n  ", header, "\n  ")
+
+                    try:
+                        src_lang = re.search("[_./](..)[_./]", first["src"]).group(1)
+                        trg_lang = re.search("[_./](..)[_./]", first["trg"]).group(1)
+                    except (AttributeError, IndexError):
+                        src_lang = "X"
+                        trg_lang = "X"
+                    link_group = {
+                        "lang": src_lang + ";" + trg_lang,
+                        "targType": "yearbook",
+                        "xtargets": first["src"] + ";" + first["trg"],
+                    }
+
+                    with xf.element("linkGrp", link_group):
+                        for aligned in itertools.chain([first], alignments):
+                            xf.write("\n    ", link_element(aligned))
+                        xf.write("\n  ")
+                    xf.write("\n")
+
+        # the serializer cannot write text after the root element
+        f.write(b"\n")
+
+
+################################################################################
+
+
+def iter_links(f_align):
+    """yields the attributes of each link of an alignment xml, clearing the parsed elements as it goes"""
+
+    for _, link in etree.iterparse(f_align, events=("end",), tag="link"):
+        yield dict(link.attrib)
+
+        # free the link and all preceding siblings that were already processed
+        link.clear()
+        while link.getprevious() is not None:
+            del link.getparent()[0]
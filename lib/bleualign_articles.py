@@ -30,20 +30,96 @@ __author__ = "Chantal Amrhein <chantal.amrhein@uzh.ch>"
 
 # imported modules
 from score import *
+import score
+from alignment_xml import write_alignments_to_xml
+import alignment_db
 import argparse
+import math
 import random
 import re
-from collections import defaultdict
+from collections import defaultdict, Counter
 import os.path
+import sys
+import numpy as np
 from lxml import etree
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
+from sklearn.pipeline import make_pipeline
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+import cProfile
 import csv
+import hashlib
+import itertools
+import mmap
+import multiprocessing
+import resource
+import time
+from contextlib import contextmanager
 
 # global variables
 # parsing xml with utf-8 encoding and removing blank text
 parser = etree.XMLParser(remove_blank_text=True, encoding="utf-8")
 
+# arbitrary low score for article pairs that are not worth computing BLEU
+FLOOR_SCORE = 0.001
+
+# minimal features to accept an article pair as parallel or comparable
+THRESHOLDS = {
+    "bleu": 0.1,
+    "overlap_numbers": 0.4,
+    "number_length_score": 0.55,
+    "cosine_similarity": 0.5,
+    "embedding_similarity": 0.8,
+}
+
+# features of the article pairs that are saved to rebuild the alignments with other thresholds
+PAIR_FEATURES = ["bleu", "overlap_numbers", "length_ratio", "cosine_similarity", "title_match"]
+
+# phases of the alignment of a year that are profiled in the stats
+PHASES = [
+    "read",
+    "cook",
+    "tfidf",
+    "candidates",
+    "titles",
+    "scoring",
+    "alignment",
+    "features",
+    "write",
+]
+
+# numbers with decimal or thousands separator and the separators themselves
+NUMBER_PATTERN = re.compile(r"\d+[,\.]\d+")
+NUMBER_SEPARATOR = re.compile(r"[,\.]")
+
+# digits are normalized in the training data of the word vectors
+DIGIT = re.compile(r"\d")
+
+# issue date in the path of an article (e.g. data_text/FedGazDe/1849/02/24/10000002.cuttered.sent.txt)
+PATH_DATE = re.compile(r"/(\d{4})/(\d{2})/(\d{2})/")
+
+# numbers in the titles of articles, and the months of the dates in the titles as numbers
+TITLE_NUMBER = re.compile(r"\d+")
+TITLE_WORD = re.compile(r"[^\W\d_]+")
+MONTHS = {
+    **dict.fromkeys(["januar", "janvier", "gennaio"], "1"),
+    **dict.fromkeys(["februar", "février", "fevrier", "febbraio"], "2"),
+    **dict.fromkeys(["märz", "maerz", "mars", "marzo"], "3"),
+    **dict.fromkeys(["april", "avril", "aprile"], "4"),
+    **dict.fromkeys(["mai", "maggio"], "5"),
+    **dict.fromkeys(["juni", "juin", "giugno"], "6"),
+    **dict.fromkeys(["juli", "juillet", "luglio"], "7"),
+    **dict.fromkeys(["august", "août", "aout", "agosto"], "8"),
+    **dict.fromkeys(["september", "septembre", "settembre"], "9"),
+    **dict.fromkeys(["oktober", "octobre", "ottobre"], "10"),
+    **dict.fromkeys(["november", "novembre"], "11"),
+    **dict.fromkeys(["dezember", "décembre", "decembre", "dicembre"], "12"),
+}
+
+# profiles and mask shared with forked scoring processes
+_scoring_data = None
+
 
 ################################################################################
 
@@ -62,7 +138,13 @@ def parse_args():
         "-trg", "--target", required=True, action="store", dest="trg", help="target text",
     )
     parser.add_argument(
-        "-t", "--translation", required=True, action="store", dest="t", help="source translation",
+        "-t",
+        "--translation",
+        required=False,
+        default=None,
+        action="store",
+        dest="t",
+        help="source translation (only optional with --scorer embedding)",
     )
     parser.add_argument(
         "-o",
@@ -73,198 +155,1238 @@ def parse_args():
         dest="output",
         help="alignment output file name",
     )
+    add_alignment_args(parser)
+
+    return parser.parse_args()
+
+
+def add_alignment_args(parser):
+    """adds the arguments that control the alignment process to the given parser"""
+
     parser.add_argument(
         "-c", "--comparable", required=False, default=False, action="store_true", dest="comp",
     )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        required=False,
+        default=1,
+        type=int,
+        action="store",
+        dest="processes",
+        help="number of processes to compute the BLEU scores of the article pairs",
+    )
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        default=500,
+        type=int,
+        action="store",
+        dest="batch_size",
+        help="number of source articles aligned per batch (0: align the whole year at once)",
+    )
+    parser.add_argument(
+        "-b",
+        "--band",
+        required=False,
+        default=None,
+        type=int,
+        action="store",
+        dest="band",
+        help="only search target articles within this many articles around the diagonal (default: full search)",
+    )
+    parser.add_argument(
+        "--min-aligned",
+        required=False,
+        default=0.5,
+        type=float,
+        action="store",
+        dest="min_aligned",
+        help="widen the band as long as fewer than this fraction of the articles get aligned",
+    )
+    parser.add_argument(
+        "--number-candidates",
+        required=False,
+        default=None,
+        type=int,
+        action="store",
+        dest="number_candidates",
+        help="only score article pairs sharing at least this many rare numbers (or lying within the band)",
+    )
+    parser.add_argument(
+        "--candidate-recall",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="candidate_recall",
+        help="additionally run the full search to report the recall of the restricted search",
+    )
+    parser.add_argument(
+        "--min-bleu",
+        required=False,
+        default=THRESHOLDS["bleu"],
+        type=float,
+        action="store",
+        dest="min_bleu",
+        help="minimal BLEU score (exclusive) of parallel articles",
+    )
+    parser.add_argument(
+        "--min-overlap-numbers",
+        required=False,
+        default=THRESHOLDS["overlap_numbers"],
+        type=float,
+        action="store",
+        dest="min_overlap_numbers",
+        help="minimal share of numbers in both articles of parallel articles found by BLEU",
+    )
+    parser.add_argument(
+        "--min-number-length-score",
+        required=False,
+        default=THRESHOLDS["number_length_score"],
+        type=float,
+        action="store",
+        dest="min_number_length_score",
+        help="minimal weighted number overlap and length ratio (exclusive) of parallel articles",
+    )
+    parser.add_argument(
+        "--min-cosine-similarity",
+        required=False,
+        default=THRESHOLDS["cosine_similarity"],
+        type=float,
+        action="store",
+        dest="min_cosine_similarity",
+        help="minimal tf/idf cosine similarity (exclusive) of comparable articles",
+    )
+    parser.add_argument(
+        "--min-embedding-similarity",
+        required=False,
+        default=THRESHOLDS["embedding_similarity"],
+        type=float,
+        action="store",
+        dest="min_embedding_similarity",
+        help="minimal cosine similarity (exclusive) of the embeddings of parallel articles found by --scorer embedding",
+    )
+    parser.add_argument(
+        "--rescore-only",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="rescore_only",
+        help="rebuild the alignments from the article pairs saved by a previous run (*_pairs.npz)",
+    )
+    parser.add_argument(
+        "--score-cache",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="score_cache",
+        help="reuse the BLEU scores of unchanged article pairs of a previous run (*_score_cache.npz)",
+    )
+    parser.add_argument(
+        "--engine",
+        required=False,
+        default="dp",
+        choices=["dp", "assignment"],
+        action="store",
+        dest="engine",
+        help="align with dynamic programming or a maximum-weight one-to-one assignment",
+    )
+    parser.add_argument(
+        "--compare-engines",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="compare_engines",
+        help="additionally align with the other engine and report the differences",
+    )
+    parser.add_argument(
+        "--max-days",
+        required=False,
+        default=None,
+        type=int,
+        action="store",
+        dest="max_days",
+        help="only score article pairs published within this many days of each other",
+    )
+    parser.add_argument(
+        "--src-metadata",
+        required=False,
+        default=None,
+        action="store",
+        dest="src_metadata",
+        help="metadata of the source articles with issue dates (e.g. article-info2-FedGazDe.tsv)",
+    )
+    parser.add_argument(
+        "--trg-metadata",
+        required=False,
+        default=None,
+        action="store",
+        dest="trg_metadata",
+        help="metadata of the target articles with issue dates (e.g. article-info2-FedGazFr.tsv)",
+    )
+    parser.add_argument(
+        "--title-prealign",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="title_prealign",
+        help="align articles of the same issue with the same numbers in their titles without BLEU (requires the metadata)",
+    )
+    parser.add_argument(
+        "--unique-src",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="unique_src",
+        help="keep only the best alignment per source article in addition to per target article",
+    )
+    parser.add_argument(
+        "--tfidf-hashing",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="tfidf_hashing",
+        help="hash the terms for the tf/idf model instead of holding a vocabulary in memory",
+    )
+    parser.add_argument(
+        "--scorer",
+        required=False,
+        default="pairwise",
+        choices=["pairwise", "sparse", "embedding"],
+        action="store",
+        dest="scorer",
+        help="score the article pairs one by one or all at once with sparse n-gram matrices, "
+        "or by the cosine similarity of cross-lingual embeddings of the untranslated articles",
+    )
+    parser.add_argument(
+        "--src-vectors",
+        required=False,
+        default=None,
+        action="store",
+        dest="src_vectors",
+        help="word vectors of the source language for --scorer embedding (e.g. vectors.150.de-fr.de.vec)",
+    )
+    parser.add_argument(
+        "--trg-vectors",
+        required=False,
+        default=None,
+        action="store",
+        dest="trg_vectors",
+        help="word vectors of the target language for --scorer embedding (e.g. vectors.150.de-fr.fr.vec)",
+    )
+    parser.add_argument(
+        "--bleu-threshold",
+        required=False,
+        default=0.0,
+        type=float,
+        action="store",
+        dest="bleu_threshold",
+        help="skip article pairs whose upper bound of the BLEU score is below the threshold",
+    )
+    parser.add_argument(
+        "--mmap",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="mmap",
+        help="read the yearly files memory-mapped (e.g. for very large years)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="cprofile",
+        help="profile the alignment of a year with cProfile and dump the stats next to the output (*.prof)",
+    )
+    parser.add_argument(
+        "--db",
+        required=False,
+        default=None,
+        action="store",
+        dest="db",
+        help="additionally store the alignments, pair features and statistics of the year in a SQLite database",
+    )
+    parser.add_argument(
+        "--exact-bleu",
+        required=False,
+        default=False,
+        action="store_true",
+        dest="exact_bleu",
+        help="count n-grams like the original BLEU implementation (e.g. for regression tests)",
+    )
+
+
+################################################################################
+
+
+def phase_clock():
+    """returns the current wall time and CPU time (including finished child processes)"""
+
+    cpu = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpu += usage.ru_utime + usage.ru_stime
+
+    return time.perf_counter(), cpu
+
+
+def reset_peak_rss():
+    """resets the peak RSS of this process (Linux only) and returns whether it was reset"""
+
+    try:
+        with open("/proc/self/clear_refs", mode="w") as f:
+            f.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def read_peak_rss():
+    """returns the peak RSS of this process since its last reset in kilobytes (Linux only)"""
+
+    with open("/proc/self/status", mode="r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+
+    return 0
+
+
+def start_phase():
+    """returns the clock at the start of a phase and resets the peak RSS to measure it per phase"""
+
+    reset = reset_peak_rss()
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return (*phase_clock(), children_rss, reset)
+
+
+def record_phase(stats, name, start):
+    """adds the wall and CPU time and the peak RSS since the start of a phase to the stats"""
+
+    if stats is None:
+        return
+
+    wall, cpu = phase_clock()
+    stats[f"phase_{name}_wall_s"] += wall - start[0]
+    stats[f"phase_{name}_cpu_s"] += cpu - start[1]
+
+    # the peak RSS is given in kilobytes on Linux
+    # without a reset (e.g. on other systems), it is the peak of the process so far
+    if start[3]:
+        peak_rss = read_peak_rss()
+    else:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # the largest child process can only be told apart if it exceeded the children before the phase
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if children_rss > start[2]:
+        peak_rss = max(peak_rss, children_rss)
+
+    stats[f"phase_{name}_peak_rss_mb"] = max(stats[f"phase_{name}_peak_rss_mb"], peak_rss / 1024)
+
+
+@contextmanager
+def timed_phase(stats, name):
+    """records the wall time, CPU time and peak RSS of the enclosed phase in the stats"""
+
+    start = start_phase()
+    try:
+        yield
+    finally:
+        record_phase(stats, name, start)
+
+
+################################################################################
+
+
+def read_articles(filename, use_mmap=False):
+    """
+    reads a yearly file line by line and yields the path and the sentences of each article
+    with the number of lines and characters (line breaks included) of its text in the file
+    (optionally from a memory-mapped file instead of a buffered file)
+    """
+
+    with open(filename, mode="rb") as infile:
+        if use_mmap and os.path.getsize(filename):
+            lines = iter(mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ).readline, b"")
+        else:
+            lines = iter(infile)
+
+        # skip the first line of the file since there is no volume organization
+        next(lines, None)
+
+        article = []
+        n_chars = 0
+        for line in lines:
+            line = line.decode("utf-8").rstrip("\n")
+            marker = line.strip()
+
+            # the articles are separated by .EOA and the volume ends with .EOB
+            if marker == ".EOA" or marker == ".EOB":
+                sentences = "\n".join(article).strip().split("\n")
+                if sentences != [""]:
+                    yield sentences[0], sentences[1:], len(article), n_chars
+                article = []
+                n_chars = 0
+                if marker == ".EOB":
+                    break
+            else:
+                article.append(line)
+                # blank lines are stripped from the sentences but still count for the corpus figures
+                n_chars += len(line.rstrip("\r")) + 1
+
+
+################################################################################
+
+
+def num_repr(sentences):
+    """extracts a list of numbers from a list of sentences in order of appearance"""
+
+    return [
+        NUMBER_SEPARATOR.sub("", word)
+        for sentence in sentences
+        for word in sentence.split()
+        if word.isnumeric() or NUMBER_PATTERN.match(word)
+    ]
+
+
+################################################################################
+
+
+class Article:
+    """
+    Article of a yearly file with everything the alignment derives from its text
+
+    The record is built once when reading the file. The tokens are split at
+    whitespace (without the header path) and interned to share equal tokens
+    between all articles of a year. The lines and characters of the article in
+    the file (including blank lines) are kept for the corpus figures.
+    """
+
+    __slots__ = (
+        "docid",
+        "path",
+        "row",
+        "tokens",
+        "n_chars",
+        "n_sentences",
+        "numbers",
+        "n_file_lines",
+        "n_file_chars",
+    )
+
+    def __init__(
+        self, docid, path, row, tokens, n_chars, n_sentences, numbers, n_file_lines, n_file_chars
+    ):
+        self.docid = docid
+        self.path = path
+        self.row = row
+        self.tokens = tokens
+        self.n_chars = n_chars
+        self.n_sentences = n_sentences
+        self.numbers = numbers
+        self.n_file_lines = n_file_lines
+        self.n_file_chars = n_file_chars
+
+    @classmethod
+    def from_sentences(cls, path, sentences, row, n_file_lines, n_file_chars):
+        """
+        creates the record of an article given its header path and sentences
+        and the number of its lines and characters in the file
+        """
+
+        return cls(
+            docid=article_docid(path),
+            path=path,
+            row=row,
+            tokens=tuple(sys.intern(token) for sent in sentences for token in sent.split()),
+            n_chars=sum(len(sent) for sent in sentences),
+            n_sentences=len(sentences),
+            numbers=frozenset(num_repr([path, *sentences])),
+            n_file_lines=n_file_lines,
+            n_file_chars=n_file_chars,
+        )
+
+    @property
+    def n_tokens(self):
+        """number of tokens without the header path"""
+
+        return len(self.tokens)
+
+    def text(self):
+        """returns the header path and the tokens of the article joined by blanks"""
+
+        return " ".join((self.path, *self.tokens))
+
+
+def read_article_records(filename, use_mmap=False):
+    """reads the articles of a yearly file as records, numbered by their row"""
+
+    articles = read_articles(filename, use_mmap)
+
+    return [
+        Article.from_sentences(path, sentences, row, n_lines, n_chars)
+        for row, (path, sentences, n_lines, n_chars) in enumerate(articles)
+    ]
+
+
+################################################################################
+
+
+def read_issue_dates(f_metadata):
+    """reads the issue date of each article from a metadata file (e.g. article-info2-FedGazDe.tsv)"""
+
+    with open(f_metadata, mode="r", encoding="utf-8", newline="") as infile:
+        reader = csv.DictReader(infile, delimiter="\t")
+        return {row["article_docid"]: row["issue_date"][:10] for row in reader}
+
+
+def read_article_titles(f_metadata):
+    """reads the title of each article from a metadata file (e.g. article-info2-FedGazDe.tsv)"""
+
+    with open(f_metadata, mode="r", encoding="utf-8", newline="") as infile:
+        reader = csv.DictReader(infile, delimiter="\t")
+        return {row["article_docid"]: row["article_title"] or "" for row in reader}
+
+
+def article_docid(path):
+    """extracts the docid from the path of an article (e.g. .../10000002.cuttered.sent.txt)"""
+
+    return os.path.basename(path.strip()).split(".")[0]
+
+
+def article_dates(articles, issue_dates=None):
+    """returns the issue date of each article, looked up by the docid in the header path of the article"""
+
+    dates = []
+    for article in articles:
+        date = None
+        if issue_dates is not None:
+            date = issue_dates.get(article.docid)
+
+        # fall back to the date in the path of the article
+        if date is None:
+            match = PATH_DATE.search(article.path)
+            date = "-".join(match.groups()) if match else "NaT"
+
+        dates.append(date)
+
+    return np.array(dates, dtype="datetime64[D]")
+
+
+################################################################################
+
+
+class AlignmentChain:
+    """
+    Persistent alignment state of a cell in the dynamic programming matrix
+
+    A chain is either a snapshot of both alignment dictionaries of a cell
+    or a single alignment appended to a parent chain. Chains are never
+    modified once created and are therefore shared between cells instead
+    of copying the dictionaries for every cell.
+    """
+
+    __slots__ = ("parent", "art", "trg", "bleu", "alignments", "targets")
+
+    def __init__(self, parent=None, art=None, trg=None, bleu=None, alignments=None, targets=None):
+        self.parent = parent
+        self.art = art
+        self.trg = trg
+        self.bleu = bleu
+        self.alignments = alignments
+        self.targets = targets
+
+    @classmethod
+    def snapshot(cls, alignments, targets):
+        """creates a chain from alignment dictionaries that are not used elsewhere anymore"""
+
+        return cls(alignments=alignments, targets=targets)
+
+    def append(self, art, trg, bleu):
+        """returns a new chain with an additional alignment of article art with target trg"""
+
+        return AlignmentChain(parent=self, art=art, trg=trg, bleu=bleu)
+
+    def materialize(self):
+        """returns fresh copies of the alignment dictionaries represented by the chain"""
+
+        # collect appended alignments up to the last snapshot
+        appended = []
+        chain = self
+        while chain.alignments is None:
+            appended.append(chain)
+            chain = chain.parent
+
+        alignments = chain.alignments.copy()
+        targets = chain.targets.copy()
+
+        # replay appended alignments in their original order
+        for link in reversed(appended):
+            alignments[link.art] = (link.trg, link.bleu)
+            targets[link.trg] = link.art
+
+        return alignments, targets
+
+
+################################################################################
+
+
+def merge_cells(current, left, i, j, raw_score):
+    """merge function for dynamic programming - isolated for testing"""
+
+    # iterate over all alignments stored in left cell
+    for art, alignment in sorted(left[1].items(), reverse=True):
+
+        # if both alignments are the same or left cell has no alignment -> skip
+        if alignment == current[1][art]:
+            pass
+        elif alignment[0] is None:
+            pass
+
+        # exchange alignments of current cell for ones from left cell
+        else:
+            # only do this if BLEU score for alignment in left cell is higher
+            if current[1][art] == () or alignment[1] > current[1][art][1]:
+                # if new target article was already part of an alignment in current cell:
+                if alignment[0] in current[2]:
+                    keep = current[2][alignment[0]]
+                    # check whether new alignment is still better than the one with the used target article
+                    if current[1][keep] == () or current[1][keep][1] < alignment[1]:
+                        # if yes delete previous alignment with target article in current cell
+                        # and add new alignment from left
+                        try:
+                            del current[2][current[1][art][0]]
+                        except IndexError:
+                            pass
+
+                        del current[1][keep]
+                        current[1][art] = alignment
+                        current[2][alignment[0]] = art
+                    else:
+                        del current[1][art]
+                # if new target article not in alignments of current cell, add new alignment
+                else:
+                    try:
+                        del current[2][current[1][art][0]]
+                    except IndexError:
+                        pass
+
+                    current[1][art] = alignment
+                    current[2][alignment[0]] = art
+
+    # calculate overall BLEU score of current cell
+    current[0] = sum([two for one, two in current[1].values()])
+
+    return current
+
+
+################################################################################
+
+
+def cook_articles(articles):
+    """cooks the BLEU profile of each article once (without the header path of the article)"""
+
+    return [cook_profile(article.tokens) for article in articles]
+
+
+def content_hashes(articles):
+    """returns a 64-bit hash of the tokens of each article (without the header path of the article)"""
+
+    return [
+        int.from_bytes(
+            hashlib.blake2b(" ".join(article.tokens).encode("utf-8"), digest_size=8).digest(),
+            "little",
+        )
+        for article in articles
+    ]
+
+
+################################################################################
+
+
+class NgramMatrices:
+    """
+    n-gram counts of articles as sparse matrix (articles x n-grams) for each order,
+    sliced by articles like a list of BLEU profiles
+    """
+
+    __slots__ = ("matrices", "lengths")
+
+    def __init__(self, matrices, lengths):
+        self.matrices = matrices
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        return NgramMatrices([matrix[index] for matrix in self.matrices], self.lengths[index])
+
+
+def ngram_matrices(trans_profiles, trg_profiles, n=4):
+    """converts the BLEU profiles of both sides to n-gram matrices with shared columns"""
+
+    if score.exact:
+        raise ValueError("the sparse scorer requires the n-gram keys of the default BLEU mode")
+
+    profiles = list(trans_profiles) + list(trg_profiles)
+    n_trans = len(trans_profiles)
+    trans_matrices = []
+    trg_matrices = []
+
+    for k in range(n):
+        # the hashed n-grams of both sides are numbered consecutively
+        keys = [profile.counts[k][0] for profile in profiles]
+        columns, indices = np.unique(np.concatenate(keys), return_inverse=True)
+        indptr = np.concatenate([[0], np.cumsum([len(row) for row in keys])])
+        data = np.concatenate([profile.counts[k][1] for profile in profiles])
+        matrix = csr_matrix((data, indices, indptr), shape=(len(profiles), len(columns)))
+
+        trans_matrices.append(matrix[:n_trans])
+        trg_matrices.append(matrix[n_trans:])
+
+    lengths = np.array([profile.length for profile in profiles])
+
+    return (
+        NgramMatrices(trans_matrices, lengths[:n_trans]),
+        NgramMatrices(trg_matrices, lengths[n_trans:]),
+    )
+
+
+class ArticleEmbeddings:
+    """
+    unit-length vectors of articles embedded in a space shared by both languages,
+    sliced by articles like a list of BLEU profiles
+    """
+
+    __slots__ = ("vectors",)
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __getitem__(self, index):
+        return ArticleEmbeddings(self.vectors[index])
+
+
+def vector_key(token):
+    """normalizes a token like the training data of the word vectors (lowercased, digits as 0)"""
+
+    return DIGIT.sub("0", token.lower())
+
+
+def read_vectors(fname, vocabulary):
+    """reads the vectors of the words in the vocabulary from a text file of multivec (e.g. vectors.100.de-fr.de.vec)"""
+
+    vectors = {}
+    with open(fname, mode="r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.rstrip("\n").split(" ", 1)
+            # skip blank lines, words without values
+            # and the optional header with the number of words and dimensions
+            if len(fields) < 2 or " " not in fields[1].strip():
+                continue
+            word, values = fields
+            if word in vocabulary:
+                vectors[word] = np.array(values.split(), dtype=np.float32)
+
+    return vectors
+
+
+def embed_articles(articles, f_vectors):
+    """embeds each article as idf-weighted mean of the vectors of its tokens"""
+
+    keys = [Counter(vector_key(token) for token in article.tokens) for article in articles]
+
+    # the idf is computed on the articles of the year like in the tf/idf model
+    document_frequency = Counter(key for counts in keys for key in counts)
+    n_docs = len(articles)
+    idf = {key: math.log((1 + n_docs) / (1 + df)) + 1 for key, df in document_frequency.items()}
+
+    vectors = read_vectors(f_vectors, document_frequency)
+    dimension = len(next(iter(vectors.values()))) if vectors else 1
+
+    embeddings = np.zeros((n_docs, dimension), dtype=np.float32)
+    for i, counts in enumerate(keys):
+        for key, count in counts.items():
+            vector = vectors.get(key)
+            if vector is not None:
+                embeddings[i] += count * idf[key] * vector
+
+    # the mean only scales the vector, hence normalizing to unit length is sufficient for the cosine
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, np.finfo(np.float32).tiny)
+
+    return ArticleEmbeddings(embeddings)
+
+
+################################################################################
+
+
+def article_lengths(articles):
+    """returns the number of tokens of each article (including its header path) as array"""
+
+    return np.array([article.n_tokens + 1 for article in articles])
+
+
+################################################################################
+
+
+def length_mask(lengths1, lengths2, min_ratio=0.6):
+    """returns a boolean matrix of all article pairs that are similar in length (number of tokens)"""
+
+    shorter = np.minimum(lengths1[:, np.newaxis], lengths2[np.newaxis, :])
+    longer = np.maximum(lengths1[:, np.newaxis], lengths2[np.newaxis, :])
+
+    return shorter / longer > min_ratio
+
+
+################################################################################
+
+
+def band_limits(i, n_rows, n_cols, band):
+    """returns the range of columns within the band around the (scaled) diagonal for row i"""
+
+    # the articles of both languages are in chronological order, hence
+    # parallel articles are expected close to the diagonal scaled by the ratio
+    ratio = n_cols / n_rows
+    half_width = int(math.ceil(band * max(1, ratio)))
+    center = int(i * ratio)
+
+    return max(0, center - half_width), min(n_cols, center + half_width + 1)
+
+
+def band_mask(n_rows, n_cols, band, rows=None, cols=None):
+    """
+    returns a boolean matrix of all cells within the band around the (scaled) diagonal,
+    optionally only of a block of rows and columns (given as ranges) of the whole matrix
+    """
 
-    return parser.parse_args()
+    rows = range(n_rows) if rows is None else rows
+    cols = range(n_cols) if cols is None else cols
+
+    mask = np.zeros((len(rows), len(cols)), dtype=bool)
+    for k, i in enumerate(rows):
+        band_start, band_end = band_limits(i, n_rows, n_cols, band)
+        band_start = max(band_start, cols.start) - cols.start
+        band_end = min(band_end, cols.stop) - cols.start
+        if band_end > band_start:
+            mask[k, band_start:band_end] = True
+
+    return mask
 
 
 ################################################################################
 
 
-def read_file(filename):
-    """reads a given file into a string"""
+def number_candidates(src_numbers, trg_numbers, min_shared=2, max_df=0.02):
+    """returns a boolean matrix of all article pairs that share at least min_shared rare numbers"""
 
-    with open(filename, mode="r", encoding="utf-8") as infile:
-        return infile.read()
+    # inverted index from each number to the target articles containing it
+    index = defaultdict(list)
+    for j, numbers in enumerate(trg_numbers):
+        for number in numbers:
+            index[number].append(j)
 
+    # numbers occurring in many articles (e.g. years, paragraph numbers) are not distinctive
+    max_articles = max(2, int(max_df * len(trg_numbers)))
 
-################################################################################
+    candidates = np.zeros((len(src_numbers), len(trg_numbers)), dtype=bool)
+    for i, numbers in enumerate(src_numbers):
+        shared = Counter()
+        for number in numbers:
+            articles = index.get(number, ())
+            if len(articles) <= max_articles:
+                shared.update(articles)
+        candidates[i, [j for j, n_shared in shared.items() if n_shared >= min_shared]] = True
 
+    return candidates
 
-def split_articles(text, string):
-    """splits a given string into articles"""
 
-    return [article for article in text.split(string) if article != "\n" and article != " \n"]
+def date_blocks(src_dates, trg_dates, max_days):
+    """returns a boolean matrix of all article pairs published within max_days of each other"""
 
+    distance = np.abs(src_dates[:, np.newaxis] - trg_dates[np.newaxis, :])
+    blocks = distance <= np.timedelta64(max_days, "D")
+
+    # articles without a known issue date are not blocked
+    blocks |= np.isnat(src_dates)[:, np.newaxis]
+    blocks |= np.isnat(trg_dates)[np.newaxis, :]
+
+    return blocks
 
-################################################################################
 
+def title_signature(title):
+    """
+    normalizes a title to the numbers it contains, including the months of dates as numbers
+
+    The words of the titles of parallel articles differ by language, but their numbers,
+    e.g. the date in "Botschaft ... (Vom 6. Dezember 1926.)", are the same.
+    """
+
+    title = title.lower()
+    numbers = [number.lstrip("0") or "0" for number in TITLE_NUMBER.findall(title)]
+    numbers += [MONTHS[word] for word in TITLE_WORD.findall(title) if word in MONTHS]
+
+    return tuple(sorted(numbers))
+
+
+def title_pairs(
+    src_articles, trg_articles, src_titles, trg_titles, src_dates, trg_dates, min_numbers=2
+):
+    """
+    proposes pairs of articles of the same issue whose titles have the same numbers
 
-def split_sentences(articles):
-    """splits all articles into sentences"""
+    A pair is only proposed if no other article of the issue in either language
+    has a title with the same numbers and if the articles have a similar length.
+    """
 
-    return [article.lstrip().rstrip().split("\n") for article in articles]
+    # index the title signatures per issue date
+    index = defaultdict(lambda: ([], []))
+    for side, articles, titles, dates in [
+        (0, src_articles, src_titles, src_dates),
+        (1, trg_articles, trg_titles, trg_dates),
+    ]:
+        for i, (article, date) in enumerate(zip(articles, dates)):
+            signature = title_signature(titles.get(article.docid, ""))
+            if len(signature) >= min_numbers and not np.isnat(date):
+                index[(str(date), signature)][side].append(i)
+
+    pairs = []
+    lengths1 = article_lengths(src_articles)
+    lengths2 = article_lengths(trg_articles)
+    for src_ids, trg_ids in index.values():
+        if len(src_ids) == 1 and len(trg_ids) == 1:
+            i, j = src_ids[0], trg_ids[0]
+            if length_mask(lengths1[i : i + 1], lengths2[j : j + 1])[0, 0]:
+                pairs.append((i, j))
+
+    return sorted(pairs)
 
 
 ################################################################################
 
 
-def num_repr(sentences):
-    """extracts a list of numbers from a list of sentences in order of appearance"""
+def score_rows(rows):
+    """computes the BLEU scores of all pairs in the mask for the given rows (executed in a forked process)"""
+
+    trans_profiles, trg_profiles, mask, threshold = _scoring_data
 
+    # each row is scored at once against all of its target articles in the mask
     return [
-        re.sub(r"[,\.]", "", word)
-        for sentence in sentences
-        for word in sentence.split()
-        if word.isnumeric() or re.match(r"\d+[,\.]\d+", word)
+        (
+            i,
+            score_profiles_batch(
+                trans_profiles[i],
+                [trg_profiles[j] for j in np.flatnonzero(mask[i])],
+                threshold=threshold,
+                floor=FLOOR_SCORE,
+            ),
+        )
+        for i in rows
     ]
 
 
-################################################################################
+def clipped_overlaps(trans_matrix, trg_matrix, rows, cols, chunk_size=10000):
+    """
+    returns the number of n-grams shared by the given article pairs,
+    each n-gram clipped to its lower count in both articles
+    """
 
+    overlaps = np.zeros(len(rows), dtype=np.int64)
+
+    # many pairs: min(a, b) is the number of thresholds t with a >= t and b >= t,
+    # hence the overlaps of all pairs are the sum of the products of the binary matrices per threshold
+    if len(rows) > 0.1 * trans_matrix.shape[0] * trg_matrix.shape[0]:
+        overlap_matrix = np.zeros((trans_matrix.shape[0], trg_matrix.shape[0]), dtype=np.int64)
+        threshold = 1
+        while True:
+            layer_trans = (trans_matrix >= threshold).astype(np.int64)
+            layer_trg = (trg_matrix >= threshold).astype(np.int64)
+            if not layer_trans.nnz or not layer_trg.nnz:
+                break
+            overlap_matrix += (layer_trans @ layer_trg.T).toarray()
+            threshold += 1
+        return overlap_matrix[rows, cols]
+
+    # few pairs: take the elementwise minimum of the rows of each pair
+    for start in range(0, len(rows), chunk_size):
+        end = start + chunk_size
+        minimum = trans_matrix[rows[start:end]].minimum(trg_matrix[cols[start:end]])
+        overlaps[start:end] = np.asarray(minimum.sum(axis=1)).ravel()
+
+    return overlaps
+
+
+def sparse_score_matrix(trans_matrices, trg_matrices, mask):
+    """computes BLEU scores for all article pairs in the mask with sparse matrix operations"""
+
+    scores = np.full(mask.shape, FLOOR_SCORE)
+    rows, cols = np.nonzero(mask)
+
+    correct = np.column_stack(
+        [
+            clipped_overlaps(trans_matrix, trg_matrix, rows, cols)
+            for trans_matrix, trg_matrix in zip(trans_matrices.matrices, trg_matrices.matrices)
+        ]
+    )
+    scores[rows, cols] = score_counts(
+        trans_matrices.lengths[rows], trg_matrices.lengths[cols], correct
+    )
 
-def write_alignments_to_xml(alignments, outfile):
-    """uses the computed alignments to generate an article alignment xml"""
+    return scores
 
-    root = etree.Element("TEI")
-    xml = etree.ElementTree(root)
 
-    if not alignments:
-        xml.write(outfile, xml_declaration=True, encoding="utf-8", pretty_print=True)
-        print("No alignments found.")
-        return None
+def embedding_score_matrix(src_embeddings, trg_embeddings, mask, block_size=1024):
+    """computes the cosine similarity of all article pairs in the mask with blocked matrix products"""
 
-    header = etree.SubElement(root, "teiHeader")
-    try:
-        header.text = alignments[0]["src"][:14]  # extract path to language folder
-    except IndexError:
-        header.text = "LANGUAGEFOLDER"
+    scores = np.full(mask.shape, FLOOR_SCORE)
+    trg_vectors = trg_embeddings.vectors.T
 
-    linkGrp = etree.SubElement(root, "linkGrp")
-    try:
-        src_lang = re.search("[_./](..)[_./]", alignments[0]["src"]).group(1)
-        trg_lang = re.search("[_./](..)[_./]", alignments[0]["trg"]).group(1)
-    except (AttributeError, IndexError):
-        src_lang = "X"
-        trg_lang = "X"
-    linkGrp.set("lang", src_lang + ";" + trg_lang)
-    linkGrp.set("targType", "yearbook")
-    linkGrp.set("xtargets", alignments[0]["src"] + ";" + alignments[0]["trg"])
-
-    for aligned in alignments:
-        article = etree.SubElement(linkGrp, "link")
-        article.set("targType", "article")
-        article.set("method", aligned.get("method"))
-        article.set("bleu", f'{aligned.get("bleu"):.2f}')
-        article.set("overlap_numbers", f'{aligned.get("overlap_numbers"):.2f}')
-        article.set("cosine_similarity", f'{aligned.get("cosine_similarity", 0):.2f}')
-        article.set("xtargets", aligned["src"] + ";" + aligned["trg"])
-
-    xml.write(outfile, xml_declaration=True, encoding="utf-8", pretty_print=True)
+    # only a block of rows of the full similarity matrix is held in memory at a time
+    for start in range(0, mask.shape[0], block_size):
+        block_mask = mask[start : start + block_size]
+        similarities = src_embeddings.vectors[start : start + block_size] @ trg_vectors
+        scores[start : start + block_size][block_mask] = np.maximum(
+            similarities[block_mask], FLOOR_SCORE
+        )
 
+    return scores
 
-################################################################################
 
+def score_matrix(trans_profiles, trg_profiles, mask, processes=1, threshold=0.0):
+    """
+    computes BLEU scores for all article pairs in the mask, all other pairs get the floor score
+    as well as the pairs whose upper bound of the BLEU score is below the threshold
+    """
 
-def merge_cells(current, left, i, j, raw_score):
-    """merge function for dynamic programming - isolated for testing"""
+    global _scoring_data
 
-    # iterate over all alignments stored in left cell
-    for art, alignment in sorted(left[1].items(), reverse=True):
+    # the sparse scorer computes all scores at once, no bounds or processes are needed
+    if isinstance(trans_profiles, NgramMatrices):
+        return sparse_score_matrix(trans_profiles, trg_profiles, mask)
+    if isinstance(trans_profiles, ArticleEmbeddings):
+        return embedding_score_matrix(trans_profiles, trg_profiles, mask)
 
-        # if both alignments are the same or left cell has no alignment -> skip
-        if alignment == current[1][art]:
-            pass
-        elif alignment[0] is None:
-            pass
+    scores = np.full(mask.shape, FLOOR_SCORE)
+    n_rows = mask.shape[0]
 
-        # exchange alignments of current cell for ones from left cell
+    # scoring each cell is independent, hence rows are split in blocks that are scored in parallel
+    # the profiles are inherited by the forked processes instead of being pickled
+    _scoring_data = (trans_profiles, trg_profiles, mask, threshold)
+    try:
+        if processes > 1 and n_rows > 1:
+            block_size = max(1, int(math.ceil(n_rows / (processes * 4))))
+            blocks = [
+                range(start, min(start + block_size, n_rows))
+                for start in range(0, n_rows, block_size)
+            ]
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                scored_blocks = pool.map(score_rows, blocks)
         else:
-            # only do this if BLEU score for alignment in left cell is higher
-            if current[1][art] == () or alignment[1] > current[1][art][1]:
-                # if new target article was already part of an alignment in current cell:
-                if alignment[0] in current[2]:
-                    keep = current[2][alignment[0]]
-                    # check whether new alignment is still better than the one with the used target article
-                    if current[1][keep] == () or current[1][keep][1] < alignment[1]:
-                        # if yes delete previous alignment with target article in current cell
-                        # and add new alignment from left
-                        try:
-                            del current[2][current[1][art][0]]
-                        except IndexError:
-                            pass
+            scored_blocks = [score_rows(range(n_rows))]
+    finally:
+        _scoring_data = None
 
-                        del current[1][keep]
-                        current[1][art] = alignment
-                        current[2][alignment[0]] = art
-                    else:
-                        del current[1][art]
-                # if new target article not in alignments of current cell, add new alignment
+    for scored_rows in scored_blocks:
+        for i, row_scores in scored_rows:
+            scores[i, mask[i]] = row_scores
+
+    return scores
+
+
+################################################################################
+
+
+class ScoreCache:
+    """
+    BLEU scores of article pairs stored on disk and keyed by the content hashes
+    of the scored (test) article and the reference article
+    """
+
+    __slots__ = ("fname", "threshold", "scores", "hits", "misses")
+
+    def __init__(self, fname, threshold=0.0):
+        self.fname = fname
+        self.threshold = threshold
+        self.scores = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(fname):
+            with np.load(fname) as cached:
+                # scores below the BLEU threshold are replaced by the floor score
+                if cached["threshold"].item() != threshold:
+                    print(f"Ignore the score cache {fname} computed with another BLEU threshold")
                 else:
-                    try:
-                        del current[2][current[1][art][0]]
-                    except IndexError:
-                        pass
+                    keys = zip(cached["tests"].tolist(), cached["refs"].tolist())
+                    self.scores = dict(zip(keys, cached["scores"].tolist()))
 
-                    current[1][art] = alignment
-                    current[2][alignment[0]] = art
+    def lookup(self, test_hashes, ref_hashes, mask):
+        """returns the cached scores of the pairs in the mask and a mask of the pairs not in the cache"""
 
-    # calculate overall BLEU score of current cell
-    current[0] = sum([two for one, two in current[1].values()])
+        scores = np.full(mask.shape, FLOOR_SCORE)
+        missing = np.zeros(mask.shape, dtype=bool)
 
-    return current
+        for i, j in zip(*np.nonzero(mask)):
+            score = self.scores.get((test_hashes[i], ref_hashes[j]))
+            if score is None:
+                missing[i, j] = True
+            else:
+                scores[i, j] = score
+
+        n_missing = int(missing.sum())
+        self.misses += n_missing
+        self.hits += int(mask.sum()) - n_missing
+
+        return scores, missing
+
+    def update(self, test_hashes, ref_hashes, mask, scores):
+        """adds the scores of the pairs in the mask"""
+
+        for i, j in zip(*np.nonzero(mask)):
+            self.scores[(test_hashes[i], ref_hashes[j])] = scores[i, j]
+
+    def save(self, hashes):
+        """saves the scores of the pairs whose articles both still exist"""
+
+        hashes = set(hashes)
+        keys = [key for key in self.scores if key[0] in hashes and key[1] in hashes]
+        evicted = len(self.scores) - len(keys)
+
+        np.savez_compressed(
+            self.fname,
+            tests=np.array([key[0] for key in keys], dtype=np.uint64),
+            refs=np.array([key[1] for key in keys], dtype=np.uint64),
+            scores=np.array([self.scores[key] for key in keys], dtype=float),
+            threshold=np.array(self.threshold),
+        )
+
+        print(
+            f"Score cache: {self.hits} hits, {self.misses} misses, "
+            f"{evicted} evicted and {len(keys)} stored scores"
+        )
 
 
 ################################################################################
 
 
-def compute_max_alignment(trans_data, trg_data):
-    """maximises BLEU score using dynamic programming techniques and returns aligned articles"""
+def compute_max_alignment(
+    trans_data,
+    trg_data,
+    trans_profiles=None,
+    trg_profiles=None,
+    band=None,
+    stats=None,
+    processes=1,
+    candidates=None,
+    blocks=None,
+    bleu_threshold=0.0,
+    engine="dp",
+    score_cache=None,
+    hashes=None,
+    known_scores=None,
+):
+    """
+    maximises BLEU score using dynamic programming techniques and returns aligned articles
+
+    band: boolean matrix of the cells within the band (e.g. a block of the band of the whole year)
+    known_scores: scores of the pairs already scored (NaN if not), updated with the new scores
+    """
+
+    # the BLEU profiles are reused for every cell of the matrix in which the article occurs
+    if trans_profiles is None:
+        trans_profiles = cook_articles(trans_data)
+    if trg_profiles is None:
+        trg_profiles = cook_articles(trg_data)
+
+    n_docs_trans = len(trans_data)
+    n_docs_trg = len(trg_data)
+
+    # Only compute BLEU score when the texts are similar in length
+    # (number of tokens) and the target article lies within the band
+    # or is a candidate (e.g. sharing rare numbers). Otherwise,
+    # an arbitrary low score is defined to speed up the alignment process
+    mask = length_mask(article_lengths(trans_data), article_lengths(trg_data))
+    if band is not None and candidates is not None:
+        mask &= band | candidates
+    elif band is not None:
+        mask &= band
+    elif candidates is not None:
+        mask &= candidates
+
+    # in any case, only pairs within the same block are compared (e.g. close issue dates)
+    if blocks is not None:
+        mask &= blocks
+
+    # the pairs scored before (e.g. with a narrower band) are not scored again
+    unscored = mask
+    if known_scores is not None:
+        unscored = mask & np.isnan(known_scores)
+
+    if stats is not None:
+        stats["dp_cells"] += mask.size
+        stats["dp_scored_cells"] += int(unscored.sum())
+
+    # compute all scores first, then run the dynamic programming over the finished matrix
+    # only the pairs that are not in the cache yet are scored
+    with timed_phase(stats, "scoring"):
+        if score_cache is None:
+            scores = score_matrix(trans_profiles, trg_profiles, unscored, processes, bleu_threshold)
+        else:
+            cached_scores, missing = score_cache.lookup(*hashes, unscored)
+            scores = score_matrix(trans_profiles, trg_profiles, missing, processes, bleu_threshold)
+            score_cache.update(*hashes, missing, scores)
+            scores[unscored & ~missing] = cached_scores[unscored & ~missing]
+
+        if known_scores is not None:
+            known = mask & ~unscored
+            scores[known] = known_scores[known]
+            known_scores[unscored] = scores[unscored]
+
+    start = start_phase()
+
+    if engine == "assignment":
+        alignments = assign_alignments(scores)
+        record_phase(stats, "alignment", start)
+        return alignments
 
     #  set up matrix for dynmic programming
     # each matrix cell looks like this:
-    # [overall BLEU score for this cell,
+    # (overall BLEU score for this cell, alignment chain of this cell)
+    # materializing the chain yields the dictionaries
     #   {source article index : (target article index, BLEU score for this article pair), ...}
     #   {target article index : source article index, ...} --> for easy access to occupied target indices
-    #  ]
+    # only the previous and the current row of the matrix are kept in memory
 
-    n_docs_trans = len(trans_data)
-    n_docs_trg = len(trg_data)
-
-    matrix = [
-        [[0.0, defaultdict(tuple), defaultdict(int)] for art2 in range(0, n_docs_trg + 1)]
-        for art in range(0, n_docs_trans + 1)
-    ]
+    empty_cell = (0.0, AlignmentChain.snapshot(defaultdict(tuple), defaultdict(int)))
+    current_row = [empty_cell] * (n_docs_trg + 1)
 
     # iterate over each cell (i,j)
-    for i, article1 in enumerate(trans_data):
-        for j, article2 in enumerate(trg_data):
+    for i in range(n_docs_trans):
+
+        previous_row = current_row
+        current_row = [empty_cell] * (n_docs_trg + 1)
+        score_row = scores[i].tolist()
+
+        for j in range(n_docs_trg):
 
             #### settings for current matrix move ####
 
             # define important cells used for dynamic programming:
 
-            above = matrix[i][j + 1]  # cell vertically above of current
-            left = matrix[i + 1][j]  # cell horizontally to the left of current
-            diag = matrix[i][j]  # cell diagonally before current
-            current = matrix[i + 1][j + 1]  # current cell
-
-            # Only compute BLEU score when the texts are similar in length
-            # (number of tokens). Otherwise, an arbitrary low score is defined
-            # to speed up the alignment process
-            art1_length = sum([len(sent.split()) for sent in article1])
-            art2_length = sum([len(sent.split()) for sent in article2])
-            ratio_length = min((art1_length, art2_length)) / max((art1_length, art2_length))
-
-            if ratio_length > 0.6:
-                # compute BLEU score between current translated source and target article:
-                refs = cook_refs([" ".join(article2).split()[1:]])
-                test = cook_test(" ".join(article1).split()[1:], refs)
-                raw_score = score_cooked([test])
-            else:
-                raw_score = 0.001
+            above = previous_row[j + 1]  # cell vertically above of current
+            left = current_row[j]  # cell horizontally to the left of current
+            diag = previous_row[j]  # cell diagonally before current
+
+            # BLEU score between current translated source and target article
+            raw_score = score_row[j]
 
             # score if alignment of current cell is used (raw_score + score of diagonal cell before)
             score = diag[0] + raw_score
@@ -281,63 +1403,152 @@ def compute_max_alignment(trans_data, trg_data):
             ):
 
                 # copy content from cell above to current cell
-                current[1] = above[1].copy()
-                current[2] = above[2].copy()
+                current = [0.0, *above[1].materialize()]
 
                 # do the merging
-                merge_cells(current, left, i, j, raw_score)
+                merge_cells(current, [left[0], *left[1].materialize()], i, j, raw_score)
+                current_row[j + 1] = (current[0], AlignmentChain.snapshot(current[1], current[2]))
 
             #  2. possible move - take cell from above
             # (if its score is higher than left cell and  diagonal cell + raw_score)
             elif above[0] >= score and above[0] >= left[0]:
-                current[0] = above[0]
-                current[1] = above[1].copy()
-                current[2] = above[2].copy()
+                current_row[j + 1] = above
 
             # 3. possible move - take cell from left
             # (if its score is higher than diagonal cell + raw_score)
             elif left[0] >= score:
-                current[0] = left[0]
-                current[1] = left[1].copy()
-                current[2] = left[2].copy()
+                current_row[j + 1] = left
 
             # 4. possible move - add current alignment to alignments from diagonal cell
             else:
-                current[0] = score
-                current[1] = diag[1].copy()
-                current[1][i] = (j, raw_score)
-                current[2] = diag[2].copy()
-                current[2][j] = i
+                current_row[j + 1] = (score, diag[1].append(i, j, raw_score))
 
     # return the resulting alignments with their BLEU scores
-    return matrix[-1][-1][1]
+    alignments = current_row[-1][1].materialize()[0]
+    record_phase(stats, "alignment", start)
+
+    return alignments
+
+
+def assign_alignments(scores):
+    """
+    maximises the sum of BLEU scores of one-to-one alignments regardless of their order
+    and returns the aligned articles like compute_max_alignment
+    """
+
+    # the assignment minimises the costs, the pairs without any score are dropped like in the DP
+    rows, cols = linear_sum_assignment(-scores)
+
+    return {
+        i: (j, float(scores[i, j]))
+        for i, j in zip(rows.tolist(), cols.tolist())
+        if scores[i, j] > 0
+    }
+
+
+################################################################################
+
+
+def fit_tfidf(trans_articles, trg_articles, hashing=False):
+    """fits a tf/idf model on all given articles and returns the rows of the translated and target articles"""
+
+    if hashing:
+        vectorizer = make_pipeline(
+            HashingVectorizer(alternate_sign=False, norm=None), TfidfTransformer()
+        )
+    else:
+        vectorizer = TfidfVectorizer()
+
+    # the articles are joined one by one instead of keeping a copy of the whole text
+    texts = (article.text() for article in itertools.chain(trans_articles, trg_articles))
+    tfidf = vectorizer.fit_transform(texts).tocsr()
+
+    return tfidf[: len(trans_articles)], tfidf[len(trans_articles) :]
 
 
 ################################################################################
 
 
-def align(src_articles, trg_articles, trans_articles):
+def align(
+    src_articles,
+    trg_articles,
+    trans_articles,
+    trg_profiles=None,
+    trans_profiles=None,
+    band=None,
+    stats=None,
+    processes=1,
+    tfidf_trg=None,
+    tfidf_trans=None,
+    candidates=None,
+    blocks=None,
+    bleu_threshold=0.0,
+    engine="dp",
+    thresholds=None,
+    score_cache=None,
+    hashes=None,
+    scorer="pairwise",
+    known_scores=None,
+):
     "performs article alignment for a magazine and its translation"
 
-    # split all articles to sentences
-    src_data = split_sentences(src_articles)
-    trg_data = split_sentences(trg_articles)
-    trans_data = split_sentences(trans_articles)
+    # each article is given as record
+    src_data = src_articles
+    trg_data = trg_articles
+    trans_data = trans_articles
+
+    # BLEU profiles may be cooked beforehand to share them across batches
+    if trg_profiles is None:
+        trg_profiles = cook_articles(trg_data)
+    if trans_profiles is None:
+        trans_profiles = cook_articles(trans_data)
 
     # get the tfidf matrix in order to find comparable articles later
-    tfidf = TfidfVectorizer().fit_transform(trans_articles + trg_articles)
+    # the rows are given when the model was already fitted for the whole year
+    if tfidf_trg is None or tfidf_trans is None:
+        tfidf_trans, tfidf_trg = fit_tfidf(trans_articles, trg_articles)
 
     #  for dynamic programming to find all alignments exchange trans_data and trg_data if the latter is larger than the former
     if len(trans_data) > len(trg_data):
-        alignments = compute_max_alignment(trg_data, trans_data)
+        alignments = compute_max_alignment(
+            trg_data,
+            trans_data,
+            trans_profiles=trg_profiles,
+            trg_profiles=trans_profiles,
+            band=None if band is None else band.T,
+            stats=stats,
+            processes=processes,
+            candidates=None if candidates is None else candidates.T,
+            blocks=None if blocks is None else blocks.T,
+            bleu_threshold=bleu_threshold,
+            engine=engine,
+            score_cache=score_cache,
+            hashes=None if hashes is None else hashes[::-1],
+            known_scores=None if known_scores is None else known_scores.T,
+        )
         swapped = True
     else:
-        alignments = compute_max_alignment(trans_data, trg_data)
+        alignments = compute_max_alignment(
+            trans_data,
+            trg_data,
+            trans_profiles=trans_profiles,
+            trg_profiles=trg_profiles,
+            band=band,
+            stats=stats,
+            processes=processes,
+            candidates=candidates,
+            blocks=blocks,
+            bleu_threshold=bleu_threshold,
+            engine=engine,
+            score_cache=score_cache,
+            hashes=hashes,
+            known_scores=known_scores,
+        )
         swapped = False
 
-    # set up dictionaries for parallel articles and comparable articles
-    definitive_alignments = []
-    comparable_alignments = []
+    # compute the features of all article pairs found by the alignment engine
+    start = start_phase()
+    pairs = []
 
     # iterate over all possible alignments found with dynamic programming
     for art, data in alignments.items():
@@ -347,32 +1558,108 @@ def align(src_articles, trg_articles, trans_articles):
         try:
             if swapped:
                 bleu = data[1]
-                src_art = src_data[data[0]]
-                trg_art = trg_data[art]
+                src_idx = data[0]
+                trg_idx = art
             else:
                 bleu = data[1]
-                src_art = src_data[art]
-                trg_art = trg_data[data[0]]
+                src_idx = art
+                trg_idx = data[0]
+            src_art = src_data[src_idx]
+            trg_art = trg_data[trg_idx]
         except (TypeError, IndexError):
             continue
 
-        # get a set of numbers occurring in each article, compute how many percent are represented in both articles
-        # If there are only few numbers, set arbitrary score as it is not reliable
-        src_nums = set(num_repr(src_art))
-        trg_nums = set(num_repr(trg_art))
+        sim_nums, sim_len, cos_sim_tfidf = pair_features(
+            src_art, trg_art, tfidf_trans[src_idx], tfidf_trg[trg_idx]
+        )
+        pairs.append(
+            {
+                "src_idx": src_idx,
+                "trg_idx": trg_idx,
+                "bleu": bleu,
+                "overlap_numbers": sim_nums,
+                "length_ratio": sim_len,
+                "cosine_similarity": cos_sim_tfidf,
+            }
+        )
 
-        if max(len(src_nums), len(trg_nums)) > 3:
-            sim_nums = len(src_nums & trg_nums) / max(len(src_nums), len(trg_nums))
-        else:
-            sim_nums = 0.4
+    definitive_alignments, comparable_alignments = classify_pairs(
+        pairs, [art.path for art in src_data], [art.path for art in trg_data], thresholds, scorer
+    )
+    record_phase(stats, "features", start)
+
+    return definitive_alignments, comparable_alignments, pairs
+
+
+def pair_features(src_art, trg_art, tfidf_src, tfidf_trg):
+    """computes the features of an article pair that are used besides its BLEU score"""
+
+    # get a set of numbers occurring in each article, compute how many percent are represented in both articles
+    # If there are only few numbers, set arbitrary score as it is not reliable
+    src_nums = src_art.numbers
+    trg_nums = trg_art.numbers
+
+    if max(len(src_nums), len(trg_nums)) > 3:
+        sim_nums = len(src_nums & trg_nums) / max(len(src_nums), len(trg_nums))
+    else:
+        sim_nums = 0.4
+
+    # get number of characters in each article, compute percentual difference of article lengths
+    len_src = src_art.n_chars
+    len_trg = trg_art.n_chars
+    sim_len = min(len_src, len_trg) / max(len_src, len_trg, 1)
+
+    # compute how similar the articles are using the tf/idf vectorizer
+    # (not available for pairs aligned by their titles before fitting the model)
+    if tfidf_src is None or tfidf_trg is None:
+        cos_sim_tfidf = math.nan
+    else:
+        cos_sim_tfidf = float(linear_kernel(tfidf_src, tfidf_trg)[0, 0])
+
+    return sim_nums, sim_len, cos_sim_tfidf
+
+
+def classify_pairs(pairs, src_ids, trg_ids, thresholds=None, scorer="pairwise"):
+    """splits article pairs into parallel and comparable alignments according to their features"""
+
+    thresholds = {**THRESHOLDS, **(thresholds or {})}
+
+    # the scores of the embedding scorer are cosine similarities instead of BLEU scores
+    if scorer == "embedding":
+        score_method = "embedding"
+        score_threshold = thresholds["embedding_similarity"]
+    else:
+        score_method = "BLEU"
+        score_threshold = thresholds["bleu"]
+
+    definitive_alignments = []
+    comparable_alignments = []
+
+    for pair in pairs:
+        bleu = pair["bleu"]
+        sim_nums = pair["overlap_numbers"]
+        src_id = src_ids[pair["src_idx"]]
+        trg_id = trg_ids[pair["trg_idx"]]
+
+        # accept pairs found by their titles as parallel articles without BLEU score
+        if pair.get("title_match"):
+            align_info = {
+                "src": src_id,
+                "trg": trg_id,
+                "method": "title_matching",
+                "bleu": bleu,
+                "overlap_numbers": sim_nums,
+            }
+            definitive_alignments.append(align_info)
+            continue
 
         # if the BLEU score > 0.1 and overlapping numbers > 0.5 accept as parallel articles
-        if bleu > 0.1 and sim_nums >= 0.4:
+        if bleu > score_threshold and sim_nums >= thresholds["overlap_numbers"]:
 
             align_info = {
-                "src": src_art[0],
-                "trg": trg_art[0],
-                "method": "BLEU",
+                "src": src_id,
+                "trg": trg_id,
+                "method": score_method,
                 "bleu": bleu,
                 "overlap_numbers": sim_nums,
             }
@@ -381,19 +1668,14 @@ def align(src_articles, trg_articles, trans_articles):
         # else check how many numbers are identical
         # weighted by the difference in length of the articles (measured with characters)
         else:
-            # get number of characters in each article, compute percentual difference of article lengths
-            len_src = sum([len(sent) for sent in src_art[1:]])
-            len_trg = sum([len(sent) for sent in trg_art[1:]])
-            sim_len = min(len_src, len_trg) / max(len_src, len_trg)
-
             # combine the two measures to a weighted score
-            weighted_sim = (0.2 * sim_len) + (0.8 * sim_nums)
+            weighted_sim = (0.2 * pair["length_ratio"]) + (0.8 * sim_nums)
 
             # if this score is higher than 0.55 also accept them as parallel articles
-            if weighted_sim > 0.55:
+            if weighted_sim > thresholds["number_length_score"]:
                 align_info = {
-                    "src": src_art[0],
-                    "trg": trg_art[0],
+                    "src": src_id,
+                    "trg": trg_id,
                     "method": "number_length_matching",
                     "bleu": bleu,
                     "overlap_numbers": sim_nums,
@@ -401,33 +1683,64 @@ def align(src_articles, trg_articles, trans_articles):
                 }
                 definitive_alignments.append(align_info)
 
-            # else compute how similar the articles are using the tf/idf vectorizer
-            else:
-                try:
-                    cos_sim_tfidf = float(
-                        linear_kernel(
-                            tfidf[src_data.index(src_art)],
-                            tfidf[len(src_data) + trg_data.index(trg_art)],
-                        )
-                    )
-
-                    # if this score is higher than 0.5 accept them as comparable articles
-                    if cos_sim_tfidf > 0.5:
-                        align_info = {
-                            "src": src_art[0],
-                            "trg": trg_art[0],
-                            "method": "tfidf",
-                            "bleu": bleu,
-                            "overlap_numbers": sim_nums,
-                            "cosine_similarity": cos_sim_tfidf,
-                        }
-                        comparable_alignments.append(align_info)
-                except IndexError:
-                    print("TODO: fix the tf-idf alignment")
+            # if the tf/idf similarity is higher than 0.5 accept them as comparable articles
+            elif pair["cosine_similarity"] > thresholds["cosine_similarity"]:
+                align_info = {
+                    "src": src_id,
+                    "trg": trg_id,
+                    "method": "tfidf",
+                    "bleu": bleu,
+                    "overlap_numbers": sim_nums,
+                    "cosine_similarity": pair["cosine_similarity"],
+                }
+                comparable_alignments.append(align_info)
 
     return definitive_alignments, comparable_alignments
 
 
+def save_pairs(fname, pairs, n_src, n_trg, search_stats=None):
+    """saves the features of the article pairs of a year and the search statistics as compressed npz"""
+
+    # only pairs aligned by their titles have a title match
+    arrays = {
+        key: np.array(
+            [pair.get(key, 0) for pair in pairs], dtype=float if key in PAIR_FEATURES else int
+        )
+        for key in ["src_idx", "trg_idx", *PAIR_FEATURES]
+    }
+    arrays["n_articles"] = np.array([n_src, n_trg])
+    for key, value in (search_stats or {}).items():
+        arrays["search_" + key] = np.array(value)
+
+    np.savez_compressed(fname, **arrays)
+
+
+def load_pairs(fname, n_src, n_trg):
+    """loads the features of the article pairs of a year and the search statistics"""
+
+    with np.load(fname) as cached:
+        if cached["n_articles"].tolist() != [n_src, n_trg]:
+            raise ValueError(f"{fname} was computed for a different number of articles")
+
+        # files of earlier versions may lack some features
+        columns = {
+            key: cached[key].tolist()
+            for key in ["src_idx", "trg_idx", *PAIR_FEATURES]
+            if key in cached.files
+        }
+        search_stats = Counter(
+            {
+                key[len("search_") :]: cached[key].item()
+                for key in cached.files
+                if key.startswith("search_")
+            }
+        )
+
+    pairs = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    return pairs, search_stats
+
+
 def corpus_figures(articles, resource, prefix):
 
     meta = {}
@@ -435,17 +1748,24 @@ def corpus_figures(articles, resource, prefix):
     meta[prefix] = resource
 
     # add corpus figures
-    meta[prefix + "_n_docs"] = len(articles)
-    content = " ".join(articles)
-    meta[prefix + "_n_chars"] = len(content)
-    meta[prefix + "_n_tokens"] = len(content.split())
-    n_sents = sum([len(split_articles(art, "\n")) for art in articles])
+    # the figures are counted on the text between the .EOA separators of the yearly file:
+    # between two articles there is another line break and a blank
+    # the split at line breaks yields the lines, an empty string at the end of each article
+    # and another one at the start of each article but the first
+    n_docs = len(articles)
+    n_separators = max(0, n_docs - 1)
+    meta[prefix + "_n_docs"] = n_docs
+    meta[prefix + "_n_chars"] = sum(art.n_file_chars for art in articles) + 2 * n_separators
+    meta[prefix + "_n_tokens"] = sum(art.n_tokens + 1 for art in articles)
+    n_sents = sum(art.n_file_lines + 1 for art in articles) + n_separators
     meta[prefix + "_n_sentences"] = n_sents
 
     return meta
 
 
-def alignment_stats(src_articles, trg_articles, definitive_alignments, comparable_alignments):
+def alignment_stats(
+    src_articles, trg_articles, definitive_alignments, comparable_alignments, search_stats=None
+):
 
     meta = {}
 
@@ -465,146 +1785,599 @@ def alignment_stats(src_articles, trg_articles, definitive_alignments, comparabl
         len(trg_articles) - len(definitive_alignments) - len(comparable_alignments)
     )
 
+    # compute how many cells of the dynamic programming were pruned without computing BLEU
+    if search_stats is not None:
+        meta["dp_cells"] = search_stats["dp_cells"]
+        meta["dp_scored_cells"] = search_stats["dp_scored_cells"]
+        meta["dp_rel_pruned"] = round(
+            1 - search_stats["dp_scored_cells"] / max(1, search_stats["dp_cells"]), 4
+        )
+        for key in [
+            "candidate_recall",
+            "engine_agreement",
+            "cache_hits",
+            "cache_misses",
+            "title_pairs",
+            "title_avoided_cells",
+        ]:
+            if key in search_stats:
+                meta[key] = search_stats[key]
+
+        # profile of the phases and the throughput of the BLEU scoring
+        # all phases are given (0 if not run), so that the stats of all years have the same columns
+        meta["dp_pruned_cells"] = search_stats["dp_cells"] - search_stats["dp_scored_cells"]
+        for name in PHASES:
+            for measure in ["wall_s", "cpu_s", "peak_rss_mb"]:
+                key = f"phase_{name}_{measure}"
+                meta[key] = round(search_stats.get(key, 0), 3)
+
+        # the throughput is unknown if no pairs were scored in this run (e.g. --rescore-only)
+        if search_stats.get("phase_scoring_wall_s", 0) > 0:
+            meta["pairs_scored_per_s"] = round(
+                search_stats["dp_scored_cells"] / search_stats["phase_scoring_wall_s"], 1
+            )
+        else:
+            meta["pairs_scored_per_s"] = ""
+
     return meta
 
 
-def filter_multi_alignments(alignments):
+def compare_engines(alignments, other_alignments, engine, other_engine, fname):
     """
-    Keep only the best alignments if an article is aligned multiple times due to batching
+    writes a report of the parallel article pairs found by either engine
+    and returns the share of pairs found by both
     """
 
-    bad_aligns = set()
+    bleu = {(a["src"], a["trg"]): a["bleu"] for a in alignments}
+    other_bleu = {(a["src"], a["trg"]): a["bleu"] for a in other_alignments}
+    pairs = sorted(bleu.keys() | other_bleu.keys())
 
-    for idx_a, align_a in enumerate(alignments):
-        best_align = idx_a
-        for idx_b, align_b in enumerate(alignments):
-            if idx_a == idx_b:
-                continue
+    with open(fname, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile, delimiter="\t")
+        writer.writerow(["src", "trg", "found_by", f"bleu_{engine}", f"bleu_{other_engine}"])
+        for pair in pairs:
+            if pair in bleu and pair in other_bleu:
+                found_by = "both"
+            else:
+                found_by = engine if pair in bleu else other_engine
+            writer.writerow([*pair, found_by, bleu.get(pair, ""), other_bleu.get(pair, "")])
 
-            # duplicate criterion on target side
-            if align_a["trg"] == align_b["trg"]:
-                if alignments[best_align]["bleu"] >= align_b["bleu"]:
-                    bad_aligns.add(idx_b)
-                else:
-                    bad_aligns.add(best_align)  # discard current best
-                    best_align = idx_b  # set new best alignment
+    shared = len(bleu.keys() & other_bleu.keys())
+    print(
+        f"Parallel pairs found by both engines: {shared}, only by {engine}: {len(bleu) - shared}, "
+        f"only by {other_engine}: {len(other_bleu) - shared}"
+    )
+
+    return round(shared / max(1, len(pairs)), 4)
+
+
+def filter_multi_alignments(alignments, by_src=False):
+    """
+    Keep only the best alignments if an article is aligned multiple times due to batching
+    """
 
-    print(f"Remove {len(bad_aligns)} duplicated alignments from a total of {len(alignments)}:")
-    for idx in bad_aligns:
-        print("\t", alignments[idx])
+    def best_per(key, candidates):
+        # keep the index of the alignment with the highest BLEU score per article
+        # (the first one in case of a tie)
+        best = {}
+        for idx in candidates:
+            article = alignments[idx][key]
+            if article not in best or alignments[idx]["bleu"] > alignments[best[article]]["bleu"]:
+                best[article] = idx
+        return set(best.values())
 
-    filtered = [align for idx, align in enumerate(alignments) if idx not in bad_aligns]
+    # duplicate criterion on target side and optionally on source side
+    keep = best_per("trg", range(len(alignments)))
+    if by_src:
+        keep = best_per("src", sorted(keep))
+
+    filtered = [align for idx, align in enumerate(alignments) if idx in keep]
+    removed = [align for idx, align in enumerate(alignments) if idx not in keep]
+
+    print(f"Remove {len(removed)} duplicated alignments from a total of {len(alignments)}:")
+    if removed:
+        print("\n".join(f"\t {align}" for align in removed))
 
     return filtered
 
 
-def batch_align(src_articles, trg_articles, trans_articles, batch_size_src=500):
+def batch_align(
+    src_articles,
+    trg_articles,
+    trans_articles,
+    batch_size_src=500,
+    band=None,
+    min_aligned=0.5,
+    search_stats=None,
+    processes=1,
+    tfidf_hashing=False,
+    min_shared_numbers=None,
+    max_days=None,
+    src_issue_dates=None,
+    trg_issue_dates=None,
+    bleu_threshold=0.0,
+    scorer="pairwise",
+    engine="dp",
+    thresholds=None,
+    score_cache=None,
+    src_vectors=None,
+    trg_vectors=None,
+):
     """
     Start batch-wise alignment process to avoid memory issues
     """
 
     definitive_alignments = []
     comparable_alignments = []
+    pairs = []
+
+    with timed_phase(search_stats, "cook"):
+        # cook the BLEU profiles of all articles only once for all batches
+        # or embed the untranslated source articles and the target articles instead
+        if scorer == "embedding":
+            trg_profiles = embed_articles(trg_articles, trg_vectors)
+            trans_profiles = embed_articles(src_articles, src_vectors)
+        else:
+            trg_profiles = cook_articles(trg_articles)
+            trans_profiles = cook_articles(trans_articles)
 
-    # ratio_src_trg = len(src_articles) / len(trg_articles)
-
-    for i, start_src in enumerate(range(0, len(src_articles), batch_size_src)):
-        end_src = min(start_src + batch_size_src, len(src_articles))
-
-        # TODO
-        # Doing a full search across all documents is too slow.
-        # Instead, search within an overlapping interval.
-        # The interval is scaled, assuming an equal distribution within a year,
-        # and increases during the process to account for irregularities in the distribution.
-        # start_trg = max(0, int(start_src / ratio_src_trg - start_src * 0.2))
-        # end_trg = min(len(trg_articles), int(end_src / ratio_src_trg + end_src * 0.2))
-        start_trg = 0
-        end_trg = len(trg_articles)
-        print("\tBATCH:", i)
-        print(
-            f"\tCompute source alignments for document range between {start_src} and {end_src} of total {len(src_articles)}"
-        )
-        print(
-            f"\tCompute target alignments for document range between {start_trg} and {end_trg} of total {len(trg_articles)}"
-        )
-        print("\t", "_" * 20)
+        # the scores of the cache are looked up by the content of the articles
+        if score_cache is None:
+            trans_hashes = None
+            trg_hashes = None
+        else:
+            trans_hashes = content_hashes(trans_articles)
+            trg_hashes = content_hashes(trg_articles)
+        if scorer == "sparse":
+            trans_profiles, trg_profiles = ngram_matrices(trans_profiles, trg_profiles)
+
+    # fit the tf/idf model only once for the whole year
+    with timed_phase(search_stats, "tfidf"):
+        tfidf_trans, tfidf_trg = fit_tfidf(trans_articles, trg_articles, tfidf_hashing)
+
+    with timed_phase(search_stats, "candidates"):
+        # optionally restrict the search to article pairs sharing rare numbers of the whole year
+        if min_shared_numbers is None:
+            candidates = None
+        else:
+            candidates = number_candidates(
+                [art.numbers for art in src_articles],
+                [art.numbers for art in trg_articles],
+                min_shared_numbers,
+            )
+
+        # optionally block the search by the issue dates of the articles
+        if max_days is None:
+            blocks = None
+        else:
+            blocks = date_blocks(
+                article_dates(src_articles, src_issue_dates),
+                article_dates(trg_articles, trg_issue_dates),
+                max_days,
+            )
+
+    n_src = len(src_articles)
+    n_trg = len(trg_articles)
+
+    # the memory of the dynamic programming grows only linearly with the number of articles,
+    # hence a whole year may be aligned at once
+    if not batch_size_src:
+        batch_size_src = max(1, n_src)
+
+    for i, start_src in enumerate(range(0, n_src, batch_size_src)):
+        end_src = min(start_src + batch_size_src, n_src)
+        batch_band = band
+
+        # the scores of the batch are kept while the band is widened to score each pair only once
+        batch_scores = None
+        if band is not None:
+            batch_scores = np.full((end_src - start_src, n_trg), np.nan)
+
+        while True:
+            # Doing a full search across all documents is too slow.
+            # Instead, search within an overlapping interval around the diagonal.
+            # The interval is scaled, assuming an equal distribution within a year,
+            # and increases if too few articles get aligned to account for irregularities in the distribution.
+            # The band is measured on the diagonal of the whole year, not of the batch.
+            if batch_band is None:
+                start_trg = 0
+                end_trg = n_trg
+                batch_band_mask = None
+            else:
+                start_trg = band_limits(start_src, n_src, n_trg, batch_band)[0]
+                end_trg = band_limits(end_src - 1, n_src, n_trg, batch_band)[1]
+                batch_band_mask = band_mask(
+                    n_src, n_trg, batch_band, range(start_src, end_src), range(start_trg, end_trg)
+                )
+
+            print("\tBATCH:", i)
+            print(
+                f"\tCompute source alignments for document range between {start_src} and {end_src} of total {n_src}"
+            )
+            print(
+                f"\tCompute target alignments for document range between {start_trg} and {end_trg} of total {n_trg}"
+            )
+            print("\t", "_" * 20)
+
+            definitive_alignments_temp, comparable_alignments_temp, pairs_temp = align(
+                src_articles[start_src:end_src],
+                trg_articles[start_trg:end_trg],
+                trans_articles[start_src:end_src],
+                trg_profiles=trg_profiles[start_trg:end_trg],
+                trans_profiles=trans_profiles[start_src:end_src],
+                band=batch_band_mask,
+                stats=search_stats,
+                processes=processes,
+                tfidf_trg=tfidf_trg[start_trg:end_trg],
+                tfidf_trans=tfidf_trans[start_src:end_src],
+                candidates=(
+                    None if candidates is None else candidates[start_src:end_src, start_trg:end_trg]
+                ),
+                blocks=None if blocks is None else blocks[start_src:end_src, start_trg:end_trg],
+                bleu_threshold=bleu_threshold,
+                engine=engine,
+                thresholds=thresholds,
+                score_cache=score_cache,
+                hashes=(
+                    None
+                    if score_cache is None
+                    else (trans_hashes[start_src:end_src], trg_hashes[start_trg:end_trg])
+                ),
+                scorer=scorer,
+                known_scores=None if batch_scores is None else batch_scores[:, start_trg:end_trg],
+            )
+
+            # stop when enough articles are aligned or the band already covers all articles
+            if batch_band is None or batch_band >= max(n_src, n_trg):
+                break
+            if len(definitive_alignments_temp) >= min_aligned * min(
+                end_src - start_src, end_trg - start_trg
+            ):
+                break
 
-        definitive_alignments_temp, comparable_alignments_temp = align(
-            src_articles[start_src:end_src], trg_articles, trans_articles[start_src:end_src],
-        )
+            batch_band *= 2
+            print(
+                f"\tOnly {len(definitive_alignments_temp)} alignments found, widen band to {batch_band}"
+            )
 
         # aggregate across batches
         definitive_alignments += definitive_alignments_temp
         comparable_alignments += comparable_alignments_temp
+        for pair in pairs_temp:
+            pair["src_idx"] += start_src
+            pair["trg_idx"] += start_trg
+        pairs += pairs_temp
+
+    # remove the scores of articles that do not exist anymore
+    if score_cache is not None:
+        score_cache.save(trans_hashes + trg_hashes)
+
+    return definitive_alignments, comparable_alignments, pairs
+
+
+def prealign_titles(
+    src_articles, trg_articles, src_metadata, trg_metadata, src_issue_dates, trg_issue_dates
+):
+    """returns the features of the article pairs that are aligned by their titles per issue"""
+
+    found = title_pairs(
+        src_articles,
+        trg_articles,
+        read_article_titles(src_metadata),
+        read_article_titles(trg_metadata),
+        article_dates(src_articles, src_issue_dates),
+        article_dates(trg_articles, trg_issue_dates),
+    )
 
-    return definitive_alignments, comparable_alignments
+    pairs = []
+    for src_idx, trg_idx in found:
+        sim_nums, sim_len, cos_sim_tfidf = pair_features(
+            src_articles[src_idx], trg_articles[trg_idx], None, None
+        )
+        pairs.append(
+            {
+                "src_idx": src_idx,
+                "trg_idx": trg_idx,
+                "bleu": math.nan,
+                "overlap_numbers": sim_nums,
+                "length_ratio": sim_len,
+                "cosine_similarity": cos_sim_tfidf,
+                "title_match": 1.0,
+            }
+        )
 
+    return pairs
 
-################################################################################
 
+################################################################################
 
-def main():
-    """main function to handle document aligning with BLEU"""
 
-    # parse arguments
-    args = parse_args()
+def align_year(options):
+    """aligns the articles of a yearly file pair and writes the alignments and their statistics"""
 
     print(
         f"""\n------------------------------------------------------------------
         Starting alignment process...
-        Name of source file: {args.src}
-        Name of target file: {args.trg}
+        Name of source file: {options.src}
+        Name of target file: {options.trg}
         """
     )
 
-    # read all files
-    src = read_file(args.src)
-    trg = read_file(args.trg)
-    trans = read_file(args.t)
-
-    # remove first and last line of file since there is no volume organization
-    src = src[src.find("\n") + 1 : src.rfind(".EOB") - 5]
-    trg = trg[trg.find("\n") + 1 : trg.rfind(".EOB") - 5]
-    trans = trans[trans.find("\n") + 1 : trans.rfind(".EOB") - 5]
-
-    # split the magazine into articles
-    src_articles = split_articles(src, ".EOA")
-    trg_articles = split_articles(trg, ".EOA")
-    trans_articles = split_articles(trans, ".EOA")
-
-    definitive_alignments, comparable_alignments = batch_align(
-        src_articles, trg_articles, trans_articles
+    score.exact = options.exact_bleu
+    # token ids are only compared within a year, a worker aligning many years must not keep them
+    score.reset_vocabulary()
+
+    # optionally profile all function calls of the year
+    profiler = None
+    if options.cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # wall time, CPU time and peak RSS of each phase are added to the statistics
+    search_stats = Counter()
+
+    if options.scorer == "embedding":
+        if not (options.src_vectors and options.trg_vectors):
+            raise ValueError("--scorer embedding requires --src-vectors and --trg-vectors")
+    elif options.t is None:
+        raise ValueError("the source translation (-t) is required unless --scorer embedding")
+
+    # read the articles of all files as records
+    # without translation, the untranslated source articles are used for the tf/idf model
+    with timed_phase(search_stats, "read"):
+        src_articles = read_article_records(options.src, options.mmap)
+        trg_articles = read_article_records(options.trg, options.mmap)
+        if options.t is None:
+            trans_articles = src_articles
+        else:
+            trans_articles = read_article_records(options.t, options.mmap)
+
+    # issue dates of the articles are taken from the metadata if available
+    src_issue_dates = None
+    trg_issue_dates = None
+    if options.src_metadata:
+        src_issue_dates = read_issue_dates(options.src_metadata)
+    if options.trg_metadata:
+        trg_issue_dates = read_issue_dates(options.trg_metadata)
+
+    thresholds = {
+        "bleu": options.min_bleu,
+        "overlap_numbers": options.min_overlap_numbers,
+        "number_length_score": options.min_number_length_score,
+        "cosine_similarity": options.min_cosine_similarity,
+        "embedding_similarity": options.min_embedding_similarity,
+    }
+
+    # the features of the article pairs are saved to rebuild the alignments with other thresholds
+    fname_pairs = options.output[:-4] + "_pairs.npz"
+    if options.rescore_only:
+        pairs, cached_stats = load_pairs(fname_pairs, len(src_articles), len(trg_articles))
+        search_stats.update(
+            {key: value for key, value in cached_stats.items() if not key.startswith("phase_")}
+        )
+        definitive_alignments, comparable_alignments = classify_pairs(
+            pairs,
+            [art.path for art in src_articles],
+            [art.path for art in trg_articles],
+            thresholds,
+            options.scorer,
+        )
+    else:
+        # the cache holds BLEU scores only
+        score_cache = None
+        if options.score_cache and options.scorer != "embedding":
+            score_cache = ScoreCache(
+                options.output[:-4] + "_score_cache.npz", options.bleu_threshold
+            )
+
+        # optionally align the articles with matching titles first and search the leftovers only
+        title_pairs_found = []
+        if options.title_prealign:
+            if not (options.src_metadata and options.trg_metadata):
+                raise ValueError("--title-prealign requires --src-metadata and --trg-metadata")
+
+            with timed_phase(search_stats, "titles"):
+                title_pairs_found = prealign_titles(
+                    src_articles,
+                    trg_articles,
+                    options.src_metadata,
+                    options.trg_metadata,
+                    src_issue_dates,
+                    trg_issue_dates,
+                )
+
+        src_aligned = {pair["src_idx"] for pair in title_pairs_found}
+        trg_aligned = {pair["trg_idx"] for pair in title_pairs_found}
+        src_search = [art for art in src_articles if art.row not in src_aligned]
+        trg_search = [art for art in trg_articles if art.row not in trg_aligned]
+        trans_search = [trans_articles[art.row] for art in src_search]
+
+        definitive_alignments, comparable_alignments, pairs = batch_align(
+            src_search,
+            trg_search,
+            trans_search,
+            batch_size_src=options.batch_size,
+            band=options.band,
+            min_aligned=options.min_aligned,
+            search_stats=search_stats,
+            processes=options.processes,
+            tfidf_hashing=options.tfidf_hashing,
+            min_shared_numbers=options.number_candidates,
+            max_days=options.max_days,
+            src_issue_dates=src_issue_dates,
+            trg_issue_dates=trg_issue_dates,
+            bleu_threshold=options.bleu_threshold,
+            scorer=options.scorer,
+            engine=options.engine,
+            thresholds=thresholds,
+            score_cache=score_cache,
+            src_vectors=options.src_vectors,
+            trg_vectors=options.trg_vectors,
+        )
+        if score_cache is not None:
+            search_stats["cache_hits"] = score_cache.hits
+            search_stats["cache_misses"] = score_cache.misses
+
+        # merge the pairs aligned by their titles with those of the search, in the order of the articles
+        for pair in pairs:
+            pair["src_idx"] = src_search[pair["src_idx"]].row
+            pair["trg_idx"] = trg_search[pair["trg_idx"]].row
+        if options.title_prealign:
+            title_alignments, _ = classify_pairs(
+                title_pairs_found,
+                [art.path for art in src_articles],
+                [art.path for art in trg_articles],
+            )
+            src_rows = {art.path: art.row for art in src_articles}
+            definitive_alignments = sorted(
+                title_alignments + definitive_alignments, key=lambda a: src_rows[a["src"]]
+            )
+            pairs = sorted(title_pairs_found + pairs, key=lambda pair: pair["src_idx"])
+
+            # the article pairs of the full search that were not considered at all for BLEU
+            search_stats["title_pairs"] = len(title_pairs_found)
+            n_cells = len(src_articles) * len(trg_articles)
+            search_stats["title_avoided_cells"] = n_cells - len(src_search) * len(trg_search)
+            print(
+                f"Aligned {search_stats['title_pairs']} article pairs by their titles, "
+                f"{search_stats['title_avoided_cells']} article pairs removed from the BLEU search"
+            )
+        save_pairs(fname_pairs, pairs, len(src_articles), len(trg_articles), search_stats)
+
+    definitive_alignments = filter_multi_alignments(definitive_alignments, options.unique_src)
+    comparable_alignments = filter_multi_alignments(comparable_alignments, options.unique_src)
+
+    # the comparisons only cover the articles that were searched, not those aligned by their titles
+    searched_alignments = [a for a in definitive_alignments if a["method"] != "title_matching"]
+
+    # compare the restricted search with the full search
+    restricted = (
+        options.band is not None
+        or options.number_candidates
+        or options.max_days is not None
+        or options.bleu_threshold > 0
     )
-    definitive_alignments = filter_multi_alignments(definitive_alignments)
-    comparable_alignments = filter_multi_alignments(comparable_alignments)
+    if options.candidate_recall and restricted and not options.rescore_only:
+        full_alignments, _, _ = batch_align(
+            src_search,
+            trg_search,
+            trans_search,
+            batch_size_src=options.batch_size,
+            processes=options.processes,
+            tfidf_hashing=options.tfidf_hashing,
+            scorer=options.scorer,
+            engine=options.engine,
+            thresholds=thresholds,
+            src_vectors=options.src_vectors,
+            trg_vectors=options.trg_vectors,
+        )
+        full_pairs = {(a["src"], a["trg"]) for a in filter_multi_alignments(full_alignments)}
+        found_pairs = {(a["src"], a["trg"]) for a in searched_alignments}
+        search_stats["candidate_recall"] = round(
+            len(full_pairs & found_pairs) / max(1, len(full_pairs)), 4
+        )
+        print(f"Recall of the restricted search: {search_stats['candidate_recall']}")
+
+    # compare the alignments with those of the other engine using the same search
+    if options.compare_engines and not options.rescore_only:
+        other_engine = "assignment" if options.engine == "dp" else "dp"
+        other_alignments, _, _ = batch_align(
+            src_search,
+            trg_search,
+            trans_search,
+            batch_size_src=options.batch_size,
+            band=options.band,
+            min_aligned=options.min_aligned,
+            processes=options.processes,
+            tfidf_hashing=options.tfidf_hashing,
+            min_shared_numbers=options.number_candidates,
+            max_days=options.max_days,
+            src_issue_dates=src_issue_dates,
+            trg_issue_dates=trg_issue_dates,
+            bleu_threshold=options.bleu_threshold,
+            scorer=options.scorer,
+            engine=other_engine,
+            thresholds=thresholds,
+            src_vectors=options.src_vectors,
+            trg_vectors=options.trg_vectors,
+        )
+        search_stats["engine_agreement"] = compare_engines(
+            searched_alignments,
+            filter_multi_alignments(other_alignments, options.unique_src),
+            options.engine,
+            other_engine,
+            options.output[:-4] + "_engines.tsv",
+        )
 
     # write alignments into xml files that optionally includes
     # heuristically similar alignments
-    if args.comp:
-        definitive_alignments += comparable_alignments
-        write_alignments_to_xml(definitive_alignments, args.output)
-    else:
-        write_alignments_to_xml(definitive_alignments, args.output)
-        fname = args.output.replace(".xml", "_comparable.xml")
-        write_alignments_to_xml(comparable_alignments, fname)
+    with timed_phase(search_stats, "write"):
+        parallel_alignments = list(definitive_alignments)
+        if options.comp:
+            definitive_alignments += comparable_alignments
+            write_alignments_to_xml(definitive_alignments, options.output)
+        else:
+            write_alignments_to_xml(definitive_alignments, options.output)
+            fname = options.output.replace(".xml", "_comparable.xml")
+            write_alignments_to_xml(comparable_alignments, fname)
 
     # prepare all statistics
     align_stats = alignment_stats(
-        src_articles, trg_articles, definitive_alignments, comparable_alignments
+        src_articles, trg_articles, definitive_alignments, comparable_alignments, search_stats
     )
-    src_stats = corpus_figures(src_articles, args.src, "src")
-    trg_stats = corpus_figures(trg_articles, args.trg, "trg")
+    src_stats = corpus_figures(src_articles, options.src, "src")
+    trg_stats = corpus_figures(trg_articles, options.trg, "trg")
 
     stats = {**align_stats, **src_stats, **trg_stats}
 
     # write alignment statistics to tsv
-    fname_stats = args.output[:-4] + "_stats.tsv"
+    fname_stats = options.output[:-4] + "_stats.tsv"
     with open(fname_stats, "w", newline="") as csvfile:
         fieldnames = sorted(stats.keys())
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter="\t")
         writer.writeheader()
         writer.writerow(stats)
 
+    # optionally store everything of the year in the database shared by all years
+    if options.db:
+        match = re.search(r"_(\d{4})_", os.path.basename(options.src))
+        year = int(match.group(1)) if match else None
+        pair_paths = (
+            {
+                **pair,
+                "src": src_articles[pair["src_idx"]].path,
+                "trg": trg_articles[pair["trg_idx"]].path,
+            }
+            for pair in pairs
+        )
+        docids = {art.path: art.docid for art in itertools.chain(src_articles, trg_articles)}
+        alignment_db.store_year(
+            options.db,
+            year,
+            [("parallel", parallel_alignments), ("comparable", comparable_alignments)],
+            pair_paths,
+            stats,
+            docids,
+        )
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(options.output[:-4] + ".prof")
+
+    return stats
+
+
+################################################################################
+
+
+def main():
+    """main function to handle document aligning with BLEU"""
+
+    # parse arguments
+    args = parse_args()
+
+    align_year(args)
+
 
 ################################################################################
 
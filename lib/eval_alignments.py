@@ -13,12 +13,15 @@ __copyright__ = "UZH, 2019"
 __status__ = "development"
 
 import glob
+import os.path
 import pandas as pd
-import xml.etree.ElementTree as ET
 import re
 import random
 import argparse
 
+from alignment_xml import iter_links
+import alignment_db
+
 
 def parse_args():
     """Parse the arguments given with program call"""
@@ -31,7 +34,7 @@ def parse_args():
         required=True,
         action="store",
         dest="dir_in",
-        help="input directory where the '*alignments.xml' are stored",
+        help="input directory where the '*alignments.xml' are stored or SQLite database of bleualign_articles.py --db",
     )
     parser.add_argument(
         "-o",
@@ -46,14 +49,51 @@ def parse_args():
         "--samples",
         required=False,
         default=10,
+        type=int,
         action="store",
         dest="n_samples",
         help="number of samples per year",
     )
+    parser.add_argument(
+        "-k",
+        "--kinds",
+        required=False,
+        default=["parallel", "comparable"],
+        nargs="+",
+        choices=["parallel", "comparable"],
+        action="store",
+        dest="kinds",
+        help="kinds of alignments to sample from a database "
+        "(default: both, like the xml of bleualign_articles.py -c)",
+    )
 
     return parser.parse_args()
 
 
+def sample_links(fname, n_samples):
+    """draws the samples in a single pass over the links of an alignment xml (reservoir sampling)"""
+
+    samples = []
+    for index, item in enumerate(iter_links(fname)):
+        if index < n_samples:
+            samples.append((index, item))
+        else:
+            replace = random.randint(0, index)
+            if replace < n_samples:
+                samples[replace] = (index, item)
+
+    return samples
+
+
+def sample_db_links(fname, year, n_samples, kinds=None):
+    """draws the samples of a year from the stored alignments, indexed by their position in the output"""
+
+    # the parallel alignments are followed by the comparable ones like in the xml
+    links = list(enumerate(alignment_db.query_pairs(fname, years=[year], kinds=kinds)))
+
+    return random.sample(links, min(n_samples, len(links)))
+
+
 def create_evaluation_schema(fname_out, dir_in, options):
     dfcols = [
         "year",
@@ -71,50 +111,47 @@ def create_evaluation_schema(fname_out, dir_in, options):
 
     df = pd.DataFrame(columns=dfcols)
 
-    for fname in glob.glob(dir_in + "*alignments.xml"):
-        etree = ET.parse(fname)
-        root = etree.getroot()
+    # the samples are drawn per year either from the database or from each alignment xml
+    if os.path.isfile(dir_in) and alignment_db.is_alignment_db(dir_in):
+        sources = [(str(year), year) for year in alignment_db.query_years(dir_in)]
+    else:
+        sources = [(fname, None) for fname in glob.glob(dir_in + "*alignments.xml")]
 
-        n_elements = len(list(root.iter(tag="link")))
+    for fname, db_year in sources:
+        if db_year is None:
+            samples = sample_links(fname, options.n_samples)
+        else:
+            samples = sample_db_links(dir_in, db_year, options.n_samples, options.kinds)
 
-        try:
-            samples = random.sample(range(0, n_elements), options.n_samples)
-        except ValueError:
+        if len(samples) < options.n_samples:
             print(
-                "Sample size is larger than number of alignments. {} will be skipped".format(
-                    fname
-                )
+                "Sample size is larger than number of alignments. {} will be skipped".format(fname)
             )
             continue
 
-        for index, item in enumerate(root.iter(tag="link")):
-            if index in samples:
-                src, trg = item.get("xtargets").split(";")
-                year = re.search(r"/(\d{4})/", src).group(1)
-                method = item.get("method")
-                score = item.get("score")
-                script_head = (
-                    "diff -W 200 -y <(head -n 30 " + src + ") <(head -n 30 " + trg + ")"
-                )
-                script_tail = (
-                    "diff -W 200 -y <(tail -n 30 " + src + ") <(tail -n 30 " + trg + ")"
-                )
-
-                attr = [
-                    year,
-                    index,
-                    src,
-                    trg,
-                    method,
-                    score,
-                    script_head,
-                    script_tail,
-                    "",
-                    "",
-                    "",
-                ]
-
-                df = df.append(pd.Series(attr, index=dfcols), ignore_index=True)
+        for index, item in sorted(samples, key=lambda sample: sample[0]):
+            src, trg = item.get("xtargets").split(";")
+            year = re.search(r"/(\d{4})/", src).group(1)
+            method = item.get("method")
+            score = item.get("score")
+            script_head = "diff -W 200 -y <(head -n 30 " + src + ") <(head -n 30 " + trg + ")"
+            script_tail = "diff -W 200 -y <(tail -n 30 " + src + ") <(tail -n 30 " + trg + ")"
+
+            attr = [
+                year,
+                index,
+                src,
+                trg,
+                method,
+                score,
+                script_head,
+                script_tail,
+                "",
+                "",
+                "",
+            ]
+
+            df = df.append(pd.Series(attr, index=dfcols), ignore_index=True)
 
     df = df.sort_values(by=["year"]).reset_index(drop=True)
 
@@ -10,14 +10,30 @@
 cook_refs(refs, n=4): Transform a list of reference sentences as strings into a form usable by cook_test().
 cook_test(test, refs, n=4): Transform a test sentence as a string (together with the cooked reference sentences) into a form usable by score_cooked().
 score_cooked(alltest, n=4): Score a list of cooked test sentences.
+score_counts(testlen, reflen, correct, n=4): Score many single comparisons given their lengths and matching n-grams.
+cook_profile(text, n=4): Transform a text into a profile that can be used as either test or single reference.
+score_profiles(test, ref, n=4, threshold=0.0, floor=0.0): Score a test profile against a reference profile.
+score_profiles_batch(test, refs, n=4, threshold=0.0, floor=0.0): Score a test profile against each of a list of reference profiles.
+bleu_upper_bound(testlen, reflen, matches, n=4): Upper bound of BLEU from lengths and unigram matches.
+
+By default, tokens are interned to integer ids and n-grams are counted with NumPy
+as packed 64-bit keys. Set exact = True to count n-grams as tuples of strings
+like the original Moses implementation (e.g. for regression tests). Both modes
+give the same scores unless two different n-grams share the same key.
 
 score_set(s, testid, refids, n=4): Interface with dataset.py; calculate BLEU score of testid against refids.
 
+The profile scorers skip pairs whose upper bound is below the threshold and return the floor
+score for them instead. The bound is first computed from the lengths only and then from the
+number of matching unigrams, before counting the matches of all n-grams.
+
 The reason for breaking the BLEU computation into three phases cook_refs(), cook_test(), and score_cooked() is to allow the caller to calculate BLEU scores for multiple test sets as efficiently as possible.
 '''
 
 #import optparse
 import sys, math, re, xml.sax.saxutils
+from collections import namedtuple
+import numpy as np
 #sys.path.append('/fs/clip-mteval/Programs/hiero')
 
 # Added to bypass NIST-style pre-processing of hyp and ref files -- wade
@@ -26,6 +42,20 @@ nonorm = 0
 preserve_case = False
 eff_ref_len = "shortest"
 
+# Count n-grams as tuples of strings instead of packed integer keys
+exact = False
+
+# token -> integer id, shared by all texts scored together (cleared with reset_vocabulary)
+vocabulary = {}
+
+# logarithm and exponential of the math module, applied to arrays (the NumPy
+# functions may differ in the last bit and would change the scores)
+array_log = np.frompyfunc(math.log, 1, 1)
+array_exp = np.frompyfunc(math.exp, 1, 1)
+
+# odd multiplier to pack the token ids of an n-gram into a single 64-bit key
+NGRAM_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
 normalize1 = [
     ('<skipped>', ''),         # strip "skipped" tags
     (r'-\n', ''),              # strip end-of-line hyphenation and join lines
@@ -53,34 +83,97 @@ def normalize(s):
     if type(s) is not str:
         s = " ".join(s)
     # language-independent part:
-    for (pattern, replace) in normalize1:
-        s = re.sub(pattern, replace, s)
-    s = xml.sax.saxutils.unescape(s, {'&quot;':'"'})
+    if exact:
+        for (pattern, replace) in normalize1:
+            s = re.sub(pattern, replace, s)
+        s = xml.sax.saxutils.unescape(s, {'&quot;':'"'})
+    else:
+        # same replacements as normalize1, skipping the passes that cannot match
+        if '<skipped>' in s:
+            s = s.replace('<skipped>', '')
+        if '\n' in s:
+            s = s.replace('-\n', '').replace('\n', ' ')
+        if '&' in s:
+            s = xml.sax.saxutils.unescape(s, {'&quot;':'"'})
     # language-dependent part (assuming Western languages):
     s = " %s " % s
     if not preserve_case:
         s = s.lower()         # this might not be identical to the original
     return [tok for tok in normalize3.split(s) if tok and tok != ' ']
 
+def reset_vocabulary():
+    '''Forgets the token ids, e.g. before the texts of the next year are scored.'''
+    vocabulary.clear()
+
+def intern_tokens(words):
+    '''Maps tokens to their integer ids, adding unseen tokens to the vocabulary.'''
+    return np.fromiter((vocabulary.setdefault(w, len(vocabulary)) for w in words),
+                       dtype=np.uint64, count=len(words))
+
 def count_ngrams(words, n=4):
-    counts = {}
+    '''Counts the n-grams of order 1 to n. In exact mode, the counts are a dict
+    with tuples of tokens as keys. Otherwise, they are a list with a pair of
+    sorted unique n-gram keys and their counts for each order.'''
+    if exact:
+        counts = {}
+        for k in range(1,n+1):
+            for i in range(len(words)-k+1):
+                ngram = tuple(words[i:i+k])
+                counts[ngram] = counts.get(ngram, 0)+1
+        return counts
+
+    ids = intern_tokens(words) + np.uint64(1)
+    keys = ids
+    counts = []
     for k in range(1,n+1):
-        for i in range(len(words)-k+1):
-            ngram = tuple(words[i:i+k])
-            counts[ngram] = counts.get(ngram, 0)+1
+        if k > 1:
+            # key of the n-gram starting at i, extended by the token at i+k-1
+            keys = keys[:-1] * NGRAM_KEY_MULTIPLIER + ids[k-1:]
+        counts.append(np.unique(keys, return_counts=True))
     return counts
 
+def max_counts(allcounts, n=4):
+    '''Takes the n-gram counts of several texts and returns the maximal count of each n-gram.'''
+    if exact:
+        maxcounts = {}
+        for counts in allcounts:
+            for (ngram,count) in counts.items():
+                maxcounts[ngram] = max(maxcounts.get(ngram,0), count)
+        return maxcounts
+
+    maxcounts = []
+    for k in range(n):
+        keys = np.concatenate([counts[k][0] for counts in allcounts])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        maxcount = np.zeros(len(unique_keys), dtype=np.int64)
+        np.maximum.at(maxcount, inverse, np.concatenate([counts[k][1] for counts in allcounts]))
+        maxcounts.append((unique_keys, maxcount))
+    return maxcounts
+
+def clipped_counts(counts, refcounts, n=4):
+    '''Returns the number of n-grams of each order that also occur in the
+    reference, clipped to the count in the reference.'''
+    correct = [0]*n
+    if exact:
+        for (ngram, count) in counts.items():
+            if len(ngram) <= n:
+                correct[len(ngram)-1] += min(refcounts.get(ngram,0), count)
+        return correct
+
+    for k in range(n):
+        keys, count = counts[k]
+        refkeys, refcount = refcounts[k]
+        _, idx, refidx = np.intersect1d(keys, refkeys, assume_unique=True, return_indices=True)
+        correct[k] = int(np.minimum(count[idx], refcount[refidx]).sum())
+    return correct
+
 def cook_refs(refs, n=4):
     '''Takes a list of reference sentences for a single segment
     and returns an object that encapsulates everything that BLEU
     needs to know about them.'''
 
     refs = [normalize(ref) for ref in refs]
-    maxcounts = {}
-    for ref in refs:
-        counts = count_ngrams(ref, n)
-        for (ngram,count) in counts.items():
-            maxcounts[ngram] = max(maxcounts.get(ngram,0), count)
+    maxcounts = max_counts([count_ngrams(ref, n) for ref in refs], n)
     return ([len(ref) for ref in refs], maxcounts)
 
 def cook_test(test, args, n=4):
@@ -107,13 +200,112 @@ def cook_test(test, args, n=4):
 
     result["guess"] = [max(len(test)-k+1,0) for k in range(1,n+1)]
 
-    result['correct'] = [0]*n
-    counts = count_ngrams(test, n)
-    for (ngram, count) in counts.items():
-        result["correct"][len(ngram)-1] += min(refmaxcounts.get(ngram,0), count)
+    result['correct'] = clipped_counts(count_ngrams(test, n), refmaxcounts, n)
 
     return result
 
+Profile = namedtuple('Profile', ['tokens', 'counts', 'length'])
+
+def cook_profile(text, n=4):
+    '''Takes a single text and returns its normalized tokens, n-gram counts
+    and length. A profile is cooked once and can then be scored against any
+    number of other profiles, serving either as test or as reference.'''
+
+    tokens = normalize(text)
+    return Profile(tokens, count_ngrams(tokens, n), len(tokens))
+
+def bleu_upper_bound(testlen, reflen, matches, n=4):
+    '''Returns an upper bound of the BLEU score given the test and reference
+    lengths and the number of matching unigrams (or an upper bound of it).
+    Since each matching k-gram starts with a matching (k-1)-gram, the matches
+    of any order cannot exceed the unigram matches nor the k-grams of either
+    text. Works on scalars as well as on arrays.'''
+
+    testlen = np.asarray(testlen, dtype=float)
+    reflen = np.asarray(reflen, dtype=float)
+    logbound = 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(1,n+1):
+            guess = np.maximum(testlen-k+1, 0)
+            logbound = logbound + np.log(np.minimum(np.minimum(matches, reflen-k+1), guess)) - np.log(guess)
+        logbound = logbound/n + np.minimum(0, 1-reflen/testlen)
+        # texts without any k-gram have no match, hence a score of 0
+        return np.nan_to_num(np.exp(logbound))
+
+def score_profiles(test, ref, n=4, threshold=0.0, floor=0.0):
+    '''Scores a test profile against a single reference profile. The result is
+    identical to score_cooked([cook_test(test, cook_refs([ref]))]), unless the
+    upper bound of the score is below the threshold and the floor is returned.'''
+
+    if threshold > 0:
+        if bleu_upper_bound(test.length, ref.length, min(test.length, ref.length), n) < threshold:
+            return floor
+        matches = clipped_counts(test.counts, ref.counts, 1)[0]
+        if bleu_upper_bound(test.length, ref.length, matches, n) < threshold:
+            return floor
+
+    result = {}
+    result["testlen"] = test.length
+    result["reflen"] = ref.length
+    result["guess"] = [max(test.length-k+1,0) for k in range(1,n+1)]
+
+    result['correct'] = clipped_counts(test.counts, ref.counts, n)
+
+    return score_cooked([result], n)
+
+def clipped_counts_batch(counts, allrefcounts, k):
+    '''Returns the clipped number of matching n-grams of order k+1 for each of
+    a list of reference counts as array.'''
+
+    keys, count = counts[k]
+    if not len(keys) or not allrefcounts:
+        return np.zeros(len(allrefcounts), dtype=np.int64)
+    refkeys = np.concatenate([refcounts[k][0] for refcounts in allrefcounts])
+    refcount = np.concatenate([refcounts[k][1] for refcounts in allrefcounts])
+    owner = np.repeat(np.arange(len(allrefcounts)), [len(refcounts[k][0]) for refcounts in allrefcounts])
+    # look up the n-grams of all references in the sorted n-grams of the test
+    idx = np.minimum(np.searchsorted(keys, refkeys), len(keys)-1)
+    found = keys[idx] == refkeys
+    clipped = np.minimum(count[idx[found]], refcount[found])
+    return np.bincount(owner[found], weights=clipped, minlength=len(allrefcounts)).astype(np.int64)
+
+def score_profiles_batch(test, refs, n=4, threshold=0.0, floor=0.0):
+    '''Scores a test profile against each of a list of reference profiles and
+    returns the scores as array. The test profile is matched with all
+    references at once and the scores are identical to score_profiles().'''
+
+    if exact or not refs:
+        return np.array([score_profiles(test, ref, n, threshold, floor) for ref in refs], dtype=float)
+
+    reflens = np.array([ref.length for ref in refs])
+    scores = np.zeros(len(refs))
+    correct = np.zeros((len(refs), n), dtype=np.int64)
+    active = np.arange(len(refs))
+
+    # narrow down the references with the bounds before counting all n-gram matches
+    if threshold > 0:
+        scores[:] = floor
+        bound = bleu_upper_bound(test.length, reflens, np.minimum(test.length, reflens), n)
+        active = active[bound >= threshold]
+        matches = clipped_counts_batch(test.counts, [refs[r].counts for r in active], 0)
+        keep = bleu_upper_bound(test.length, reflens[active], matches, n) >= threshold
+        active = active[keep]
+        correct[active, 0] = matches[keep]
+        scores[active] = 0.0
+        orders = range(1, n)
+    else:
+        orders = range(n)
+
+    for k in orders:
+        correct[active, k] = clipped_counts_batch(test.counts, [refs[r].counts for r in active], k)
+
+    # the score is 0 if an order has no match, otherwise it is combined like in score_cooked()
+    guess = [max(test.length-k+1,0) for k in range(1,n+1)]
+    for r in active[correct[active].all(axis=1)]:
+        comps = {"testlen": test.length, "reflen": refs[r].length, "guess": guess, "correct": correct[r].tolist()}
+        scores[r] = score_cooked([comps], n)
+    return scores
+
 def score_cooked(allcomps, n=4):
     totalcomps = {'testlen':0, 'reflen':0, 'guess':[0]*n, 'correct':[0]*n}
     for comps in allcomps:
@@ -132,3 +324,26 @@ def score_cooked(allcomps, n=4):
     #log.write("Effective reference length: %d test length: %d\n" % (totalcomps['reflen'], totalcomps['testlen']))
     logbleu += min(0,1-float(totalcomps['reflen'])/totalcomps['testlen'])
     return math.exp(logbleu)
+
+def score_counts(testlen, reflen, correct, n=4):
+    '''Scores many single comparisons at once. Takes arrays of the test and
+    reference lengths and a matrix with the matching n-grams of each order
+    (one row per comparison) and returns an array of BLEU scores identical to
+    score_cooked() of each comparison.'''
+
+    testlen = np.asarray(testlen, dtype=float)
+    reflen = np.asarray(reflen, dtype=float)
+    correct = np.asarray(correct, dtype=float).reshape(-1, n)
+    scores = np.zeros(len(correct))
+
+    # the score is 0 if an order has no match
+    matched = (correct > 0).all(axis=1)
+    testlen = testlen[matched]
+    reflen = reflen[matched]
+    logbleu = np.zeros(len(testlen))
+    for k in range(n):
+        logbleu += (array_log(correct[matched, k]) - array_log(testlen-k)).astype(float)
+    logbleu /= float(n)
+    logbleu += np.minimum(0, 1-reflen/testlen)
+    scores[matched] = array_exp(logbleu).astype(float)
+    return scores
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+################################################################################
+# Driver to translate a yearly file (e.g. de_1849_all.txt) in shards.
+#
+# The yearly file is split at the .EOA boundaries of its articles into shards
+# with a similar number of sentences. The same translation command (e.g. the
+# preprocessing and the Moses decoder) is run on all shards concurrently, each
+# reading its shard from stdin and writing the translation to stdout.
+#
+# The translation command has to translate line by line. The translated shards
+# are concatenated in the order of the articles, hence the output is the same as
+# the translation of the whole year in a single run, including the header and
+# the .EOA/.EOB markers.
+################################################################################
+
+# imported modules
+import argparse
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+################################################################################
+
+
+def parse_args():
+    """parses the arguments given with program call"""
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        action="store",
+        dest="f_in",
+        help="yearly file to translate (e.g. de_1849_all.txt)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        action="store",
+        dest="f_out",
+        help="translated yearly file (e.g. de_fr_1849_trans.txt)",
+    )
+    parser.add_argument(
+        "-c",
+        "--command",
+        required=True,
+        action="store",
+        dest="command",
+        help="shell command translating stdin to stdout line by line (e.g. the preprocessing and moses)",
+    )
+    parser.add_argument(
+        "-n",
+        "--shards",
+        required=False,
+        default=4,
+        type=int,
+        action="store",
+        dest="n_shards",
+        help="number of shards the yearly file is split into",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        default=None,
+        type=int,
+        action="store",
+        dest="jobs",
+        help="maximal number of shards translated at the same time (default: number of shards)",
+    )
+
+    return parser.parse_args()
+
+
+################################################################################
+
+
+def read_blocks(f_in):
+    """
+    reads a yearly file as blocks of lines that are never split:
+    the articles up to and including their .EOA line, and the lines before and after them
+    """
+
+    blocks = []
+    block = []
+
+    with open(f_in, mode="r", encoding="utf-8", newline="") as f:
+        for line in f:
+            block.append(line)
+            if line.strip() == ".EOA":
+                blocks.append(block)
+                block = []
+
+    # the footer with .EOB (and the header of a file without articles)
+    if block:
+        blocks.append(block)
+
+    return blocks
+
+
+def split_shards(blocks, n_shards):
+    """splits the blocks into at most n_shards consecutive shards with a similar number of lines"""
+
+    total = sum(len(block) for block in blocks)
+    shards = []
+    shard = []
+    n_lines = 0
+
+    for block in blocks:
+        shard.append(block)
+        n_lines += len(block)
+
+        # close the shard once it reaches its share of all lines
+        if len(shards) < n_shards - 1 and n_lines >= total * (len(shards) + 1) / n_shards:
+            shards.append(shard)
+            shard = []
+
+    if shard:
+        shards.append(shard)
+
+    return shards
+
+
+def count_markers(lines):
+    """counts the lines with .EOA and .EOB markers"""
+
+    return sum(1 for line in lines if line.strip() in (".EOA", ".EOB"))
+
+
+def translate_shard(command, f_shard, f_translated):
+    """runs the translation command on a shard and returns an error message if it failed"""
+
+    with open(f_shard, mode="rb") as f_in, open(f_translated, mode="wb") as f_out:
+        process = subprocess.run(command, shell=True, stdin=f_in, stdout=f_out)
+
+    if process.returncode != 0:
+        return f"command exited with {process.returncode}"
+
+    with open(f_shard, mode="r", encoding="utf-8", newline="") as f:
+        lines = f.readlines()
+    with open(f_translated, mode="r", encoding="utf-8", newline="") as f:
+        translated = f.readlines()
+
+    # the articles can only be reassembled if each line is translated and the markers are kept
+    if len(translated) != len(lines):
+        return f"{len(translated)} instead of {len(lines)} lines translated"
+    if count_markers(translated) != count_markers(lines):
+        return f"{count_markers(translated)} instead of {count_markers(lines)} .EOA/.EOB markers"
+
+    return None
+
+
+def translate_shards(f_in, f_out, command, n_shards=4, jobs=None):
+    """translates a yearly file in shards and writes the translated shards in order"""
+
+    shards = split_shards(read_blocks(f_in), max(1, n_shards))
+
+    # the shards are written next to the output to avoid filling up a small temporary directory
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(f_out))) as dir_tmp:
+        f_shards = []
+        for i, shard in enumerate(shards):
+            f_shard = os.path.join(dir_tmp, f"shard_{i:04d}.txt")
+            with open(f_shard, mode="w", encoding="utf-8", newline="") as f:
+                for block in shard:
+                    f.writelines(block)
+            f_shards.append((f_shard, f_shard[:-4] + "_trans.txt"))
+
+        print(f"Translate {f_in} in {len(shards)} shard(s)")
+
+        # the workers only wait for the translation processes, hence threads are sufficient
+        with ThreadPoolExecutor(max_workers=jobs or len(shards)) as executor:
+            errors = list(executor.map(lambda shard: translate_shard(command, *shard), f_shards))
+
+        failed = [(i, error) for i, error in enumerate(errors) if error is not None]
+        if failed:
+            for i, error in failed:
+                print(f"Error during the translation of shard {i} of {f_in}: {error}")
+            return False
+
+        # reassemble the translated shards in the order of the articles
+        with open(f_out, mode="wb") as f:
+            for _, f_translated in f_shards:
+                with open(f_translated, mode="rb") as f_shard:
+                    shutil.copyfileobj(f_shard, f)
+
+    return True
+
+
+################################################################################
+
+
+def main():
+    """main function to translate a yearly file in shards"""
+
+    # parse arguments
+    args = parse_args()
+
+    if not translate_shards(args.f_in, args.f_out, args.command, args.n_shards, args.jobs):
+        sys.exit(1)
+
+
+################################################################################
+
+if __name__ == "__main__":
+
+    main()
@@ -59,29 +59,48 @@ de-fr-trans-doc-files:=$(subst de,de_fr,$(pdf-FedGazDe-files:.txt=_trans.txt))
 de-fr-trans-target: $(de-fr-trans-doc-files)
 
 # Translate the German doc into French
-de_fr_%_trans.txt: de_%_all.txt
-	cat $< | \
-	perl /mnt/storage/clfiles/resources/applications/mt/moses/vGitHub/scripts/tokenizer/lowercase.perl | \
+MOSES_CHAIN:= perl /mnt/storage/clfiles/resources/applications/mt/moses/vGitHub/scripts/tokenizer/lowercase.perl | \
 	perl /mnt/storage/clfiles/resources/applications/mt/moses/vGitHub/scripts/tokenizer/escape-special-chars.perl | \
 	moses -f mt_moses/train_de_fr/binarised_model/moses.ini -v 0 -threads 1 --minphr-memory --minlexr-memory | \
 	perl /mnt/storage/clfiles/resources/applications/mt/moses/vGitHub/scripts/tokenizer/deescape-special-chars.perl | \
 	sed -r "s/^\.eoa/.EOA/" | \
-	sed -r "s/^\.eob/.EOB/" \
+	sed -r "s/^\.eob/.EOB/"
+
+# Optionally, translate each year in shards of articles that are translated concurrently
+# (e.g. make -f make_caller.mk TRANS_SHARDS=8 de-fr-trans-target)
+ifdef TRANS_SHARDS
+de_fr_%_trans.txt: de_%_all.txt
+	python3 -u lib/translate_shards.py -i $< -o $@ -n $(TRANS_SHARDS) -c '$(MOSES_CHAIN)' \
+	|| echo 'Error during Moses translation process for the following year: ' $@ >> log_moses.txt
+else
+de_fr_%_trans.txt: de_%_all.txt
+	cat $< | \
+	$(MOSES_CHAIN) \
 	> $@ \
 	|| echo 'Error during Moses translation process for the following year: ' $@ >> log_moses.txt
+endif
 
 # Compute BLEU-alignments for German and French documents
 de-fr-align-doc-files:=$(patsubst %, $(ALIGN_DIR)/de_fr_%_align.xml, $(YEARS))
 de-fr-align-stats-files:=$(de-fr-align-doc-files:.xml=_stats.tsv)
 de-fr-align-doc-target: $(de-fr-align-doc-files) $(de-fr-align-stats-files) $(de-fr-trans-doc-files)
 
+# Reuse the BLEU scores of unchanged article pairs when a year is aligned again
+ALIGN_CACHE?= --score-cache
 de_fr_%_align.xml: de_%_all.txt fr_%_all.txt de_fr_%_trans.txt
 	python3 -u lib/bleualign_articles.py -src $(word 1, $^) -trg $(word 2, $^) \
-	-t $(word 3, $^) -o $@ -c
+	-t $(word 3, $^) -o $@ -c $(ALIGN_CACHE)
 
 de_fr_%_align_stats.tsv: de_fr_%_align.xml
 	@echo "The bleualign_articles.py implicitly creates $@ with stats in addition to $<"
 
+# Alternatively, align all years in a single invocation with a bounded pool of workers
+# (the yearly files and their translations are built first like for the single years)
+ALIGN_JOBS?= 4
+de-fr-align-all-years-target: $(de-single-doc-files) $(fr-single-doc-files) $(de-fr-trans-doc-files)
+	python3 -u lib/bleualign_articles_parallel.py -i $(ALIGN_DIR) -o $(ALIGN_DIR) \
+	-y $(YEARS_START)-$(YEARS_END) -j $(ALIGN_JOBS) -c $(ALIGN_CACHE)
+
 # Collect the alignment stats per language pair and merge them into single tsv
 de-fr-total-stats-align-target: $(ALIGN_DIR)/total_align_stats_de_fr.tsv $(de-fr-align-stats-files)
 